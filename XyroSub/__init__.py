@@ -1,9 +1,9 @@
 import logging
 import sys
 from pathlib import Path
-from typing import Final, List
+from typing import Any, Dict, Final, List, Optional
 
-from XyroSub.helpers.yaml import load_config
+from XyroSub.helpers.yaml import get_config_value, load_config
 
 # Initialize Logger
 logger = logging.getLogger("[XyroSub]")
@@ -41,12 +41,71 @@ SUPPORT_BOT: Final[str] = telegram_config.get("support_bot")
 ANNOUNCE_CHANNEL: Final[str] = telegram_config.get("announce_channel")
 DROP_UPDATES: Final[bool] = telegram_config.get("drop_updates", True)
 PREMIUM_CHANNEL: Final[int] = int(telegram_config.get("premium_channel_id"))
+# Single-use premium channel invite links kept ready for new payments, 0 mints
+# every link on demand
+INVITE_POOL_SIZE: Final[int] = get_config_value(telegram_config,
+                                                "invite_pool_size", 10)
+INVITE_LINK_LIFETIME: Final[int] = get_config_value(telegram_config,
+                                                    "invite_link_lifetime",
+                                                    172800)
+# Upper bound on bulk sends, Telegram allows about 30 messages per second
+MESSAGES_PER_SECOND: Final[float] = get_config_value(
+    telegram_config, "messages_per_second", 25)
+# Separate budget for posts to the admin group, Telegram allows about 20 per
+# minute in a group
+ADMIN_MESSAGES_PER_MINUTE: Final[float] = get_config_value(
+    telegram_config, "admin_messages_per_minute", 20)
 
 # Database Constants
 SCHEMA: Final[str] = database_config.get("schema")
+# Optional read replica for lookups and reports, writes always use SCHEMA
+REPLICA_SCHEMA: Final[Optional[str]] = database_config.get("replica_schema")
+DB_POOL_SIZE: Final[int] = database_config.get("pool_size")
+DB_MAX_OVERFLOW: Final[int] = database_config.get("max_overflow")
+DB_POOL_TIMEOUT: Final[int] = database_config.get("pool_timeout")
+DB_POOL_RECYCLE: Final[int] = get_config_value(database_config,
+                                               "pool_recycle", -1)
+DB_POOL_PRE_PING: Final[bool] = get_config_value(database_config,
+                                                 "pool_pre_ping", True)
+SUBSCRIPTION_CACHE_SIZE: Final[int] = get_config_value(
+    database_config, "subscription_cache_size", 1024)
+SUBSCRIPTION_CACHE_TTL: Final[int] = get_config_value(
+    database_config, "subscription_cache_ttl", 300)
+# Applied to every new SQLite connection, config.yml values override these
+SQLITE_PRAGMAS: Final[Dict[str, Any]] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 268435456,
+    "cache_size": -64000,
+    "temp_store": "MEMORY",
+    **{
+        pragma: value
+        for pragma, value in (database_config.get("sqlite") or {}).items()
+        if value is not None
+    },
+}
 
 # Misc Constants
 DISABLED_PLUGINS: Final[List[str]] = misc_config.get("disable", [])
+# Billing events (invoices and expiries) handled at the same time
+BILLING_CONCURRENCY: Final[int] = get_config_value(misc_config,
+                                                   "billing_concurrency", 16)
+# Seconds between checks for jobs queued by other processes
+JOB_POLL_INTERVAL: Final[float] = get_config_value(misc_config,
+                                                   "job_poll_interval", 30)
+# Seconds between reloads of the blacklist, picking up bans made elsewhere
+BLACKLIST_REFRESH_INTERVAL: Final[float] = get_config_value(
+    misc_config, "blacklist_refresh_interval", 60)
+# Premium channel kicks handled at the same time
+KICK_CONCURRENCY: Final[int] = get_config_value(misc_config,
+                                                "kick_concurrency", 16)
+# Routine admin notifications are posted as a digest every this many seconds,
+# or sooner once this many are waiting
+ADMIN_DIGEST_INTERVAL: Final[float] = get_config_value(
+    misc_config, "admin_digest_interval", 60)
+ADMIN_DIGEST_SIZE: Final[int] = get_config_value(misc_config,
+                                                 "admin_digest_size", 50)
 
 # PRICING
 BASIC_PLAN_PRICE: Final[int] = pricing_config.get("basic_plan_price")
@@ -55,6 +114,34 @@ PREMIUM_PLAN_PRICE: Final[int] = pricing_config.get("premium_plan_price")
 BASIC_PLAN_DAYS: Final[int] = pricing_config.get("basic_plan_days")
 STANDARD_PLAN_DAYS: Final[int] = pricing_config.get("standard_plan_days")
 PREMIUM_PLAN_DAYS: Final[int] = pricing_config.get("premium_plan_days")
+# Any number of plans can be listed under pricing.plans, otherwise the three
+# legacy plans above are used. Plans without a price are not offered.
+PLANS_CONFIG: Final[List[Dict[str, Any]]] = pricing_config.get("plans") or [
+    {
+        "id": "basic",
+        "name": "Basic",
+        "price": BASIC_PLAN_PRICE,
+        "days": BASIC_PLAN_DAYS,
+        "billing": "monthly",
+        "term": "1 Month",
+    },
+    {
+        "id": "standard",
+        "name": "Standard",
+        "price": STANDARD_PLAN_PRICE,
+        "days": STANDARD_PLAN_DAYS,
+        "billing": "quarterly",
+        "term": "3 Months",
+    },
+    {
+        "id": "premium",
+        "name": "Premium",
+        "price": PREMIUM_PLAN_PRICE,
+        "days": PREMIUM_PLAN_DAYS,
+        "billing": "half-yearly",
+        "term": "6 Months",
+    },
+]
 
 # Affiliate
 MINIMUM_COMMISSION_WITHDRAW: Final[int] = affiliate_config.get(
@@ -8,7 +8,16 @@ from pyrogram.handlers.handler import Handler
 
 from XyroSub import (API_HASH, API_ID, BOT_TOKEN, DISABLED_PLUGINS,
                      DROP_UPDATES, PROJECT_DIR, logger)
-from XyroSub.database import start_db
+from XyroSub.database import start_db, stop_db
+from XyroSub.database.affiliate import load_affiliate_codes
+from XyroSub.database.discount import load_discount_catalogue
+from XyroSub.database.users import (flush_new_users, load_blacklist,
+                                    load_invite_link_pool, load_known_users,
+                                    load_premium_members, refresh_blacklist)
+from XyroSub.helpers.invite_pool import maintain_invite_link_pool
+from XyroSub.helpers.kicks import process_kicks
+from XyroSub.helpers.notifications import process_admin_digests
+from XyroSub.modules.members import sync_premium_members
 from XyroSub.modules.start import set_all_bot_commands
 from XyroSub.modules.subscription import auto_send_invoices
 
@@ -24,6 +33,12 @@ app = Client("XyroSubBot",
 def main():
     loop = asyncio.get_event_loop()
     loop.run_until_complete(start_db())
+    loop.run_until_complete(load_blacklist())
+    loop.run_until_complete(load_known_users())
+    loop.run_until_complete(load_affiliate_codes())
+    loop.run_until_complete(load_discount_catalogue())
+    loop.run_until_complete(load_invite_link_pool())
+    loop.run_until_complete(load_premium_members())
 
     plugins_glob = str(PROJECT_DIR / "XyroSub" / "modules" / "*.py")
     all_plugins = sorted([Path(p) for p in glob.glob(plugins_glob)],
@@ -50,11 +65,19 @@ def main():
 
     loop.create_task(set_all_bot_commands(client=app))
     loop.create_task(auto_send_invoices(app))
+    loop.create_task(maintain_invite_link_pool(app))
+    loop.create_task(sync_premium_members(app))
+    loop.create_task(process_kicks(app))
+    loop.create_task(process_admin_digests(app))
+    loop.create_task(refresh_blacklist())
 
     logger.info("Starting the Pyrogram Client now...")
 
     app.run()
 
+    loop.run_until_complete(flush_new_users())
+    loop.run_until_complete(stop_db())
+
 
 if __name__ == "__main__":
     main()
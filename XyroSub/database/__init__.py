@@ -1,43 +1,314 @@
 import glob
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import (Any, AsyncIterator, Callable, Dict, Iterable, List,
+                    Optional, Union)
 
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy import event, func, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (AsyncSession, async_sessionmaker,
+                                    create_async_engine)
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from XyroSub import DISABLED_PLUGINS, PROJECT_DIR, SCHEMA, logger
+from XyroSub import (DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE,
+                     DB_POOL_SIZE, DB_POOL_TIMEOUT, DISABLED_PLUGINS,
+                     PROJECT_DIR, REPLICA_SCHEMA, SCHEMA, SQLITE_PRAGMAS,
+                     logger)
 
 BASE = declarative_base()
 
+POOL_STATS: Dict[str, Dict[str, float]] = {}
+
+
+def _engine_options(schema: str) -> Dict[str, Any]:
+    options: Dict[str, Any] = {
+        "echo": False,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    url = make_url(schema)
+    if url.get_backend_name() == "sqlite":
+        # In-memory SQLite runs on a StaticPool, which has no size or overflow.
+        if url.database in (None, "", ":memory:"):
+            return options
+        # aiosqlite defaults to a NullPool for files, reopening the database
+        # (and reapplying the pragmas) for every session.
+        options["poolclass"] = AsyncAdaptedQueuePool
+    if DB_POOL_SIZE is not None:
+        options["pool_size"] = DB_POOL_SIZE
+    if DB_MAX_OVERFLOW is not None:
+        options["max_overflow"] = DB_MAX_OVERFLOW
+    if DB_POOL_TIMEOUT is not None:
+        options["pool_timeout"] = DB_POOL_TIMEOUT
+    return options
+
+
+engine = create_async_engine(SCHEMA, **_engine_options(SCHEMA))
+async_session = async_sessionmaker(bind=engine,
+                                   autoflush=True,
+                                   expire_on_commit=False)
+
+if REPLICA_SCHEMA:
+    read_engine = create_async_engine(REPLICA_SCHEMA,
+                                      **_engine_options(REPLICA_SCHEMA))
+else:
+    # Without a replica, reads share the primary engine and its pool.
+    read_engine = engine
+async_read_session = async_sessionmaker(bind=read_engine,
+                                        autoflush=True,
+                                        expire_on_commit=False)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+for _engine in {engine, read_engine}:
+    if _engine.dialect.name == "sqlite":
+        event.listen(_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
+
+def _track_pool(name: str, tracked_engine) -> None:
+    stats = POOL_STATS[name] = {
+        "connects": 0,
+        "checkouts": 0,
+        "checkins": 0,
+        "checked_out": 0,
+        "peak_checked_out": 0,
+        "overflow_checkouts": 0,
+        "waits": 0,
+        "total_wait": 0.0,
+        "max_wait": 0.0,
+    }
+    sync_engine = tracked_engine.sync_engine
+
+    def on_connect(dbapi_connection, connection_record) -> None:
+        stats["connects"] += 1
+
+    def on_checkout(dbapi_connection, connection_record,
+                    connection_proxy) -> None:
+        stats["checkouts"] += 1
+        stats["checked_out"] += 1
+        stats["peak_checked_out"] = max(stats["peak_checked_out"],
+                                        stats["checked_out"])
+        pool_size = getattr(tracked_engine.pool, "size", None)
+        if callable(pool_size) and stats["checked_out"] > pool_size():
+            stats["overflow_checkouts"] += 1
+
+    def on_checkin(dbapi_connection, connection_record) -> None:
+        stats["checkins"] += 1
+        stats["checked_out"] = max(0, stats["checked_out"] - 1)
+
+    # The pool has no event for a checkout being requested, so time the
+    # call that waits for a free (or new) connection instead.
+    raw_connection = sync_engine.raw_connection
+
+    def timed_raw_connection():
+        started = time.monotonic()
+        try:
+            return raw_connection()
+        finally:
+            waited = time.monotonic() - started
+            stats["waits"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+
+    event.listen(sync_engine, "connect", on_connect)
+    event.listen(sync_engine, "checkout", on_checkout)
+    event.listen(sync_engine, "checkin", on_checkin)
+    sync_engine.raw_connection = timed_raw_connection
+
+
+_track_pool("primary", engine)
+if read_engine is not engine:
+    _track_pool("replica", read_engine)
+
+
+@asynccontextmanager
+async def session_scope(
+        session: Optional[AsyncSession] = None,
+        read_only: bool = False) -> AsyncIterator[AsyncSession]:
+    """Run a database helper inside ``session`` or in its own transaction.
+
+    Without a session, a new one is opened and committed when the block exits.
+    With one, the block joins that unit of work: nothing is committed here, and
+    the caller's own ``session_scope()`` commits or rolls back every step at
+    once.
+
+    ``read_only`` helpers get their new session from the read replica when one
+    is configured. A passed-in session is always used as is, so reads inside a
+    unit of work still see its uncommitted writes on the primary.
+    """
+    if session is not None:
+        yield session
+        return
+
+    sessionmaker = async_read_session if read_only else async_session
+    async with sessionmaker() as new_session:
+        async with new_session.begin():
+            yield new_session
+
+
+def on_commit(session: AsyncSession, callback: Callable[[], None]) -> None:
+    """Call ``callback`` once the current transaction of ``session`` commits.
+
+    Used to keep in-memory caches in step with the database: nothing happens
+    if the transaction rolls back, and inside a unit of work the callback waits
+    for the outer commit.
+    """
+    event.listen(session.sync_session,
+                 "after_commit",
+                 lambda _: callback(),
+                 once=True)
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    engines = {"primary": engine, "replica": read_engine}
+    pool_stats: Dict[str, Dict[str, Any]] = {}
+    for name, stats in POOL_STATS.items():
+        pool_stats[name] = dict(
+            stats,
+            pool=engines[name].pool.status(),
+            avg_wait_ms=(stats["total_wait"] / stats["waits"] *
+                         1000) if stats["waits"] else 0.0,
+            max_wait_ms=stats["max_wait"] * 1000)
+    return pool_stats
+
+
+async def atomic_increment(session: AsyncSession,
+                           column,
+                           delta: Any,
+                           *criteria,
+                           only_if: Optional[Any] = None,
+                           **values) -> Optional[Any]:
+    """Add ``delta`` to ``column`` inside the database and return the new value.
+
+    Any extra ``values`` are set in the same UPDATE. Returns None when no row
+    matched ``criteria`` and ``only_if``. Dialects without UPDATE ... RETURNING
+    (MySQL, SQLite older than 3.35) read the value back inside the same
+    transaction, by ``criteria`` alone, so ``only_if`` is where conditions on
+    the value before the increment go.
+    """
+    guard = () if only_if is None else (only_if, )
+    statement = update(column.class_).where(*criteria, *guard).values(
+        {
+            column.key: func.coalesce(column, 0) + delta,
+            **values
+        }).execution_options(synchronize_session=False)
+
+    if session.bind.dialect.update_returning:
+        result = await session.execute(statement.returning(column))
+        return result.scalars().first()
+
+    result = await session.execute(statement)
+    if not result.rowcount:
+        return None
+    return (await session.execute(select(column).where(*criteria))
+            ).scalars().first()
+
+
+async def upsert(session: AsyncSession,
+                 model,
+                 values: Union[Dict[str, Any], List[Dict[str, Any]]],
+                 conflict_columns: Iterable[str],
+                 update_columns: Iterable[str] = (),
+                 increment_columns: Iterable[str] = (),
+                 where=None) -> int:
+    """Insert ``values`` or update the row that conflicts on ``conflict_columns``.
+
+    ``values`` may also be a list of rows, inserted with one multi-row INSERT.
+
+    ``update_columns`` take the incoming value and ``increment_columns`` add it
+    to the stored one. With neither, a conflicting row is left untouched. An
+    optional ``where`` restricts which existing rows may be updated.
+
+    Uses INSERT ... ON CONFLICT on SQLite/PostgreSQL and INSERT ... ON
+    DUPLICATE KEY UPDATE on MySQL. Returns the affected row count; MySQL also
+    counts a conflicting row that was left unchanged.
+    """
+    table = model.__table__
+    dialect_name = session.bind.dialect.name
+
+    if dialect_name in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect_name == "sqlite" else postgresql.insert
+        statement = insert(table).values(values)
+        incoming = statement.excluded
+    elif dialect_name in ("mysql", "mariadb"):
+        statement = mysql.insert(table).values(values)
+        incoming = statement.inserted
+    else:
+        raise NotImplementedError(
+            f"upsert is not supported for the '{dialect_name}' dialect")
+
+    set_values = {column: incoming[column] for column in update_columns}
+    set_values.update({
+        column: func.coalesce(table.c[column], 0) + incoming[column]
+        for column in increment_columns
+    })
+
+    if dialect_name in ("mysql", "mariadb"):
+        if not set_values:
+            statement = statement.prefix_with("IGNORE")
+        else:
+            if where is not None:
+                set_values = {
+                    column: func.IF(where, value, table.c[column])
+                    for column, value in set_values.items()
+                }
+            statement = statement.on_duplicate_key_update(set_values)
+    elif not set_values:
+        statement = statement.on_conflict_do_nothing(
+            index_elements=list(conflict_columns))
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=list(conflict_columns),
+            set_=set_values,
+            where=where)
+
+    result = await session.execute(statement)
+    return result.rowcount
+
 
 async def start_db() -> None:
-    engine = create_async_engine(SCHEMA)
     logger.info("[ORM] Connecting to database...")
-    async_session = async_sessionmaker(bind=engine,
-                                       autoflush=True,
-                                       expire_on_commit=False)
-
-    async with async_session() as session:
-        async with session.begin():
-            logger.info("[ORM] Creating tables inside database now...")
-            async with engine.begin() as conn:
-                database_plugins_glob = str(PROJECT_DIR / "NeoSupport" /
-                                            "database" / "*.py")
-                database_plugins = sorted([
-                    Path(plugin) for plugin in glob.glob(database_plugins_glob)
-                ],
-                                          key=lambda p: p.stem)
-                enabled_database_plugins = [
-                    plugin for plugin in database_plugins
-                    if plugin.is_file() and plugin.stem not in DISABLED_PLUGINS
-                    and plugin.name != "__init__.py"
-                ]
-
-                for plugin_path in enabled_database_plugins:
-                    module_path = f"NeoSupport.database.{plugin_path.stem}"
-                    logger.info(
-                        f"[DATABASE] [LOAD] importing and creating tables from '{module_path}'"
-                    )
-                    __import__(module_path)
-
-                await conn.run_sync(BASE.metadata.create_all)
-            logger.info("[ORM] Connection successful, session started.")
+
+    async with engine.begin() as conn:
+        logger.info("[ORM] Creating tables inside database now...")
+        database_plugins_glob = str(PROJECT_DIR / "XyroSub" / "database" /
+                                    "*.py")
+        database_plugins = sorted(
+            [Path(plugin) for plugin in glob.glob(database_plugins_glob)],
+            key=lambda p: p.stem)
+        enabled_database_plugins = [
+            plugin for plugin in database_plugins
+            if plugin.is_file() and plugin.stem not in DISABLED_PLUGINS
+            and plugin.name != "__init__.py"
+        ]
+
+        for plugin_path in enabled_database_plugins:
+            module_path = f"XyroSub.database.{plugin_path.stem}"
+            logger.info(
+                f"[DATABASE] [LOAD] importing and creating tables from '{module_path}'"
+            )
+            __import__(module_path)
+
+        await conn.run_sync(BASE.metadata.create_all)
+    logger.info(
+        f"[ORM] Connection successful, pool status: {engine.pool.status()}")
+    if read_engine is not engine:
+        logger.info(
+            f"[ORM] Routing read-only queries to replica at {read_engine.url!r}"
+        )
+
+
+async def stop_db() -> None:
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+    logger.info("[ORM] Database connections closed.")
@@ -1,18 +1,19 @@
-import asyncio
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import BigInteger, Column, Float, String, select, UniqueConstraint
+from sqlalchemy import BigInteger, Column, Float, Index, String, delete, func, select, UniqueConstraint
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from XyroSub import SCHEMA, logger
-from XyroSub.database import BASE
-from XyroSub.database.subscription import get_all_transactions_user
+from XyroSub import logger
+from XyroSub.database import (BASE, async_session, atomic_increment,
+                              session_scope, upsert)
+from XyroSub.database.subscription import Subscriptions
 
-engine = create_async_engine(SCHEMA, echo=False)
-async_session = async_sessionmaker(bind=engine,
-                                   autoflush=True,
-                                   expire_on_commit=False)
+# Affiliate code -> affiliate user and the reverse, loaded by
+# load_affiliate_codes() at startup and kept current by set_affiliate_settings().
+# Codes created by other processes are looked up in the database on a miss.
+AFFILIATE_CODES: Dict[str, int] = {}
+AFFILIATE_CODE_BY_USER: Dict[int, str] = {}
 
 
 class AffiliateUsers(BASE):
@@ -21,6 +22,9 @@ class AffiliateUsers(BASE):
     affiliate_user = Column(BigInteger, nullable=False)
     referred_user = Column(BigInteger, primary_key=True, nullable=False)
 
+    __table_args__ = (Index('ix_affiliate_users_affiliate_user',
+                            'affiliate_user'), )
+
     def __init__(self, affiliate_user: int, referred_user: int) -> None:
         self.affiliate_user = affiliate_user
         self.referred_user = referred_user
@@ -36,6 +40,13 @@ class AffiliateSettings(BASE):
     affiliate_code = Column(String, primary_key=True, nullable=False)
     earnings = Column(Float, default=0.0)
 
+    __table_args__ = (
+        Index('ix_affiliate_settings_affiliate_code', 'affiliate_code'),
+        Index('ux_affiliate_settings_affiliate_user',
+              'affiliate_user',
+              unique=True),
+    )
+
     def __init__(self,
                  affiliate_user: int,
                  affiliate_code: str,
@@ -56,6 +67,8 @@ class Referrals(BASE):
     amount_earned = Column(Float, default=0.0)
     short_id = Column(String, unique=True, nullable=False)
 
+    __table_args__ = (Index('ix_referrals_affiliate_user_id',
+                            'affiliate_user_id'), )
 
     def __init__(self, affiliate_user_id: int, referred_user_id: int, amount_earned: float, short_id: str) -> None:
         self.affiliate_user_id = affiliate_user_id
@@ -67,26 +80,16 @@ class Referrals(BASE):
         return f'Referrals: affiliate_user_id: {self.affiliate_user_id}, referred_user_id: {self.referred_user_id}, amount_earned: {self.amount_earned}, short_id: {self.short_id}'
 
 
-AFFILIATE_USER_LOCK = asyncio.Lock()
-AFFILIATE_SETTINGS_LOCK = asyncio.Lock()
-
-
 async def save_affiliate_user(affiliate_user: int, referred_user: int) -> None:
     try:
-        async with AFFILIATE_USER_LOCK:
-            async with async_session() as session:
-                async with session.begin():
-                    statement = select(AffiliateUsers).where(
-                        AffiliateUsers.referred_user == referred_user)
-                    ref_user = (
-                        await session.execute(statement)).scalar_one_or_none()
-                    if ref_user:
-                        ref_user.affiliate_user = affiliate_user
-                    else:
-                        ref_user = AffiliateUsers(
-                            affiliate_user=affiliate_user,
-                            referred_user=referred_user)
-                        session.add(ref_user)
+        async with async_session() as session:
+            async with session.begin():
+                await upsert(session,
+                             AffiliateUsers, {
+                                 "affiliate_user": affiliate_user,
+                                 "referred_user": referred_user
+                             }, ["referred_user"],
+                             update_columns=["affiliate_user"])
     except SQLAlchemyError as sqex:
         logger.error(
             f'Error while saving affiliate user, for affiliate_user: {affiliate_user} and referred_user: {referred_user}\n\
@@ -111,165 +114,215 @@ async def delete_affiliate_user(referred_user_id: int) -> Optional[bool]:
         logger.error(f'Failed to delete affiliate user for referred_user_id: {referred_user_id}\nActual error: {sqex}')
         return False
 
-async def get_affiliate_user(referred_user: int) -> Optional[AffiliateUsers]:
+
+async def delete_affiliate_users(
+        referred_user_ids: List[int],
+        session: Optional[AsyncSession] = None) -> int:
+    async with session_scope(session) as db_session:
+        result = await db_session.execute(
+            delete(AffiliateUsers).where(
+                AffiliateUsers.referred_user.in_(referred_user_ids)))
+        return result.rowcount
+
+async def get_affiliate_user(
+        referred_user: int,
+        session: Optional[AsyncSession] = None) -> Optional[AffiliateUsers]:
     try:
-        async with AFFILIATE_USER_LOCK:
-            async with async_session() as session:
-                async with session.begin():
-                    statement = select(AffiliateUsers).where(
-                        AffiliateUsers.referred_user == referred_user)
-                    ref_user = (
-                        await session.execute(statement)).scalar_one_or_none()
-                    return ref_user
+        async with session_scope(session) as db_session:
+            statement = select(AffiliateUsers).where(
+                AffiliateUsers.referred_user == referred_user)
+            ref_user = (
+                await db_session.execute(statement)).scalar_one_or_none()
+            return ref_user
     except SQLAlchemyError as sqex:
         logger.error(
             f'Error while fetching affiliated user, for referred_user: {referred_user}\n\
 Actual error: {sqex}')
+        if session is not None:
+            raise
 
 
 async def set_affiliate_settings(affiliate_user: int, affiliate_code: str,
                                  earnings: float) -> None:
     try:
-        async with AFFILIATE_SETTINGS_LOCK:
-            async with async_session() as session:
-                async with session.begin():
-                    statement = select(AffiliateSettings).where(
-                        AffiliateSettings.affiliate_user == affiliate_user)
-                    aff_user = (
-                        await session.execute(statement)).scalar_one_or_none()
-                    if aff_user:
-                        aff_user.affiliate_code = affiliate_code
-                        aff_user.earnings = aff_user.earnings + earnings
-                    else:
-                        aff_user = AffiliateSettings(
-                            affiliate_user=affiliate_user,
-                            affiliate_code=affiliate_code,
-                            earnings=earnings)
-                        session.add(aff_user)
+        async with async_session() as session:
+            async with session.begin():
+                await upsert(session,
+                             AffiliateSettings, {
+                                 "affiliate_user": affiliate_user,
+                                 "affiliate_code": affiliate_code,
+                                 "earnings": earnings
+                             }, ["affiliate_user"],
+                             update_columns=["affiliate_code"],
+                             increment_columns=["earnings"])
     except SQLAlchemyError as sqex:
         logger.error(
             f'Error while saving affiliate settings, for affiliate_user: {affiliate_user}, with code: {affiliate_code} and earnings: {earnings}\n\
 Actual error: {sqex}')
+        return
+
+    _remember_affiliate_code(affiliate_user, affiliate_code)
+
+
+def _remember_affiliate_code(affiliate_user: int, affiliate_code: str) -> None:
+    previous_code = AFFILIATE_CODE_BY_USER.get(affiliate_user)
+    if previous_code is not None and previous_code != affiliate_code:
+        AFFILIATE_CODES.pop(previous_code, None)
+    AFFILIATE_CODES[affiliate_code] = affiliate_user
+    AFFILIATE_CODE_BY_USER[affiliate_user] = affiliate_code
+
+
+async def load_affiliate_codes() -> int:
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                select(AffiliateSettings.affiliate_code,
+                       AffiliateSettings.affiliate_user))
+            rows = result.all()
+
+    AFFILIATE_CODES.clear()
+    AFFILIATE_CODE_BY_USER.clear()
+    for affiliate_code, affiliate_user in rows:
+        AFFILIATE_CODES[affiliate_code] = affiliate_user
+        AFFILIATE_CODE_BY_USER[affiliate_user] = affiliate_code
+    logger.info(f"Loaded {len(AFFILIATE_CODES)} affiliate codes")
+    return len(AFFILIATE_CODES)
+
+
+async def get_affiliate_user_by_code(affiliate_code: str) -> Optional[int]:
+    affiliate_user = AFFILIATE_CODES.get(affiliate_code)
+    if affiliate_user is None:
+        aff_set = await fetch_affiliate_settings_by_code(affiliate_code)
+        if aff_set is not None:
+            _remember_affiliate_code(aff_set.affiliate_user,
+                                     aff_set.affiliate_code)
+            affiliate_user = aff_set.affiliate_user
+    return affiliate_user
+
+
+async def get_affiliate_code(affiliate_user: int) -> Optional[str]:
+    affiliate_code = AFFILIATE_CODE_BY_USER.get(affiliate_user)
+    if affiliate_code is None:
+        aff_set = await get_affiliate_settings(affiliate_user)
+        if aff_set is not None:
+            _remember_affiliate_code(aff_set.affiliate_user,
+                                     aff_set.affiliate_code)
+            affiliate_code = aff_set.affiliate_code
+    return affiliate_code
 
 
 async def get_affiliate_settings(
         affiliate_user: int) -> Optional[AffiliateSettings]:
     try:
-        async with AFFILIATE_SETTINGS_LOCK:
-            async with async_session() as session:
-                async with session.begin():
-                    statement = select(AffiliateSettings).where(
-                        AffiliateSettings.affiliate_user == affiliate_user)
-                    aff_user = (
-                        await session.execute(statement)).scalar_one_or_none()
-                    return aff_user
+        async with async_session() as session:
+            async with session.begin():
+                statement = select(AffiliateSettings).where(
+                    AffiliateSettings.affiliate_user == affiliate_user)
+                aff_user = (
+                    await session.execute(statement)).scalar_one_or_none()
+                return aff_user
     except SQLAlchemyError as sqex:
         logger.error(
             f'Failed to fetch AffiliateSettings for affiliate_user: {affiliate_user}\n\
 Actual error: {sqex}')
 
 
-async def modify_earnings(affiliate_user: int,
-                          earnings: float) -> Optional[bool]:
+async def fetch_affiliate_settings_by_code(
+        affiliate_code: str) -> Optional[AffiliateSettings]:
     try:
-        async with AFFILIATE_SETTINGS_LOCK:
-            async with async_session() as session:
-                async with session.begin():
-                    statement = select(AffiliateSettings).where(
-                        AffiliateSettings.affiliate_user == affiliate_user)
-                    aff_user = (
-                        await session.execute(statement)).scalar_one_or_none()
-                    if not aff_user:
-                        return None
-                    aff_user.earnings = aff_user.earnings + earnings
-                    return True
+        async with async_session() as session:
+            async with session.begin():
+                statement = select(AffiliateSettings).where(
+                    AffiliateSettings.affiliate_code == affiliate_code)
+                aff_set = (
+                    await session.execute(statement)).scalar_one_or_none()
+                return aff_set
     except SQLAlchemyError as sqex:
         logger.error(
-            f'Failed to modify balance for affiliate_user: {affiliate_user}, by XTR: {earnings}\n\
+            f'Error while fetching AffiliateSettings with affiliate_code: {affiliate_code}\n\
 Actual error: {sqex}')
-        return False
 
 
-async def fetch_affiliate_settings_by_code(
-        affiliate_code: str) -> Optional[AffiliateSettings]:
+async def modify_earnings(
+        affiliate_user: int,
+        earnings: float,
+        session: Optional[AsyncSession] = None) -> Optional[bool]:
     try:
-        async with AFFILIATE_SETTINGS_LOCK:
-            async with async_session() as session:
-                async with session.begin():
-                    statement = select(AffiliateSettings).where(
-                        AffiliateSettings.affiliate_code == affiliate_code)
-                    aff_set = (
-                        await session.execute(statement)).scalar_one_or_none()
-                    return aff_set
+        async with session_scope(session) as db_session:
+            updated = await atomic_increment(
+                db_session, AffiliateSettings.earnings, earnings,
+                AffiliateSettings.affiliate_user == affiliate_user)
+            if updated is None:
+                return None
+            return True
     except SQLAlchemyError as sqex:
         logger.error(
-            f'Error while fetching AffiliateSettings with affiliate_code: {affiliate_code}\n\
+            f'Failed to modify balance for affiliate_user: {affiliate_user}, by XTR: {earnings}\n\
 Actual error: {sqex}')
+        if session is not None:
+            raise
+        return False
 
 
 async def get_commission_info(
-    affiliate_user: int
+    affiliate_user: int,
+    session: Optional[AsyncSession] = None
 ) -> Tuple[Optional[float], Optional[int], Optional[int]]:
-    earnings, referred_users, total_users = 0.0, 0, 0
     try:
-        async with AFFILIATE_USER_LOCK:
-            async with async_session() as session:
-                async with session.begin():
-                    statement = select(AffiliateUsers).where(
-                        AffiliateUsers.affiliate_user == affiliate_user)
-                    ref_users = (await
-                                 session.execute(statement)).scalars().all()
-                    total_users = len(ref_users)
-                    for ref_user in ref_users:
-                        sub_user = (await get_all_transactions_user(
-                            user_id=ref_user.referred_user))
-                        if sub_user and sub_user[0]:
-                            referred_users += 1
-        async with AFFILIATE_SETTINGS_LOCK:
-            async with async_session() as session:
-                async with session.begin():
-                    statement = select(AffiliateSettings).where(
-                        AffiliateSettings.affiliate_user == affiliate_user)
-                    aff_user = (
-                        await session.execute(statement)).scalar_one_or_none()
-                    if aff_user:
-                        earnings = aff_user.earnings
-        return earnings, referred_users, total_users
+        async with session_scope(session, read_only=True) as db_session:
+            earnings_statement = select(AffiliateSettings.earnings).where(
+                AffiliateSettings.affiliate_user ==
+                affiliate_user).limit(1).scalar_subquery()
+            statement = select(
+                earnings_statement,
+                func.count(Subscriptions.user_id.distinct()),
+                func.count(AffiliateUsers.referred_user.distinct()),
+            ).select_from(AffiliateUsers).outerjoin(
+                Subscriptions, Subscriptions.user_id ==
+                AffiliateUsers.referred_user).where(
+                    AffiliateUsers.affiliate_user == affiliate_user)
+            earnings, referred_users, total_users = (
+                await db_session.execute(statement)).one()
+            return earnings or 0.0, referred_users, total_users
     except SQLAlchemyError as sqex:
         logger.error(
             f'Error while fetching commission and referred users info for affiliate_user: {affiliate_user}\n\
 Actual error: {sqex}')
+        if session is not None:
+            raise
         return None, None, None
 
 
-async def add_referral(affiliate_user_id: int, referred_user_id: int, amount_earned: float, short_id: str) -> bool:
+async def add_referral(affiliate_user_id: int, referred_user_id: int, amount_earned: float, short_id: str,
+                       session: Optional[AsyncSession] = None) -> bool:
     try:
-        async with async_session() as session:
-            async with session.begin():
-                # Check if the referral already exists
-                existing_referral = await session.execute(
-                    select(Referrals).where(
-                        Referrals.affiliate_user_id == affiliate_user_id,
-                        Referrals.referred_user_id == referred_user_id
-                    )
-                )
-                if existing_referral.scalar_one_or_none():
-                    logger.info(f"Referral already exists for affiliate {affiliate_user_id} and user {referred_user_id}. No bonus awarded.")
-                    return False  # The referral already exists; exit without creating a new entry
-
-                # Create a new referral entry
-                referral = Referrals(
-                    affiliate_user_id=affiliate_user_id,
-                    referred_user_id=referred_user_id,
-                    amount_earned=amount_earned,
-                    short_id=short_id
+        async with session_scope(session) as db_session:
+            # Check if the referral already exists
+            existing_referral = await db_session.execute(
+                select(Referrals).where(
+                    Referrals.affiliate_user_id == affiliate_user_id,
+                    Referrals.referred_user_id == referred_user_id
                 )
-                session.add(referral)
-                await session.commit()
-            logger.info(f'Referral added for affiliate_user_id={affiliate_user_id}, referred_user_id={referred_user_id}.')
-            return True  # New referral added
+            )
+            if existing_referral.scalar_one_or_none():
+                logger.info(f"Referral already exists for affiliate {affiliate_user_id} and user {referred_user_id}. No bonus awarded.")
+                return False  # The referral already exists; exit without creating a new entry
+
+            # Create a new referral entry
+            referral = Referrals(
+                affiliate_user_id=affiliate_user_id,
+                referred_user_id=referred_user_id,
+                amount_earned=amount_earned,
+                short_id=short_id
+            )
+            db_session.add(referral)
+            await db_session.flush()
+        logger.info(f'Referral added for affiliate_user_id={affiliate_user_id}, referred_user_id={referred_user_id}.')
+        return True  # New referral added
     except SQLAlchemyError as sqex:
         logger.error(f'Failed to add referral for affiliate_user_id: {affiliate_user_id}, referred_user_id: {referred_user_id}, amount_earned: {amount_earned}, short_id: {short_id}\nActual error: {sqex}')
+        if session is not None:
+            raise
         return False
 
 async def get_referral_by_short_id(short_id: str) -> Optional[Referrals]:
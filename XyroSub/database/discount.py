@@ -1,19 +1,15 @@
 from datetime import datetime, timezone
-from typing import List, Optional
+from typing import Dict, List, Optional, Set
 
 import sqlalchemy
-from sqlalchemy import (BigInteger, Boolean, Column, Float, Integer, String,
-                        UniqueConstraint, select)
+from sqlalchemy import (BigInteger, Boolean, Column, Float, Index, Integer,
+                        String, UniqueConstraint, exists, select)
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from XyroSub import SCHEMA, logger
-from XyroSub.database import BASE
-
-engine = create_async_engine(SCHEMA, echo=False)
-async_session = async_sessionmaker(bind=engine,
-                                   autoflush=True,
-                                   expire_on_commit=False)
+from XyroSub import logger
+from XyroSub.database import (BASE, async_session, atomic_increment,
+                              on_commit, session_scope)
 
 
 class Discounts(BASE):
@@ -65,9 +61,10 @@ class DiscountUsage(BASE):
     usage_time = Column(Float,
                         default=lambda: datetime.now(timezone.utc).timestamp())
 
-    __table_args__ = (UniqueConstraint('discount_id',
-                                       'user_id',
-                                       name='_discount_user_uc'), )
+    __table_args__ = (
+        UniqueConstraint('discount_id', 'user_id', name='_discount_user_uc'),
+        Index('ix_discount_usage_user_id', 'user_id', 'discount_id'),
+    )
 
     def __init__(self, discount_id: int, user_id: int):
         self.discount_id = discount_id
@@ -77,6 +74,59 @@ class DiscountUsage(BASE):
         return f"<DiscountUsage discount_id={self.discount_id} user_id={self.user_id} usage_time={self.usage_time}>"
 
 
+# Active discounts by id and the discount ids each user has redeemed. Loaded by
+# load_discount_catalogue() at startup and kept current by the writers below,
+# so the handlers can evaluate discounts without touching the database.
+ACTIVE_DISCOUNTS: Dict[int, Discounts] = {}
+USED_DISCOUNTS: Dict[int, Set[int]] = {}
+
+
+def _track_discount(discount: Discounts) -> None:
+    # Discounts that ran out of uses can't be offered any more either.
+    if discount.active and (discount.max_uses is None
+                            or discount.usage_count < discount.max_uses):
+        ACTIVE_DISCOUNTS[discount.id] = discount
+    else:
+        ACTIVE_DISCOUNTS.pop(discount.id, None)
+
+
+def _track_discount_usage(discount_id: int, user_id: int) -> None:
+    USED_DISCOUNTS.setdefault(user_id, set()).add(discount_id)
+
+
+def _current_discounts() -> List[Discounts]:
+    now = datetime.now(timezone.utc).timestamp()
+    expired = [
+        discount_id for discount_id, discount in ACTIVE_DISCOUNTS.items()
+        if discount.expiry_time is not None and discount.expiry_time <= now
+    ]
+    for discount_id in expired:
+        ACTIVE_DISCOUNTS.pop(discount_id, None)
+    return sorted(ACTIVE_DISCOUNTS.values(), key=lambda d: d.id)
+
+
+async def load_discount_catalogue() -> int:
+    async with async_session() as session:
+        async with session.begin():
+            discounts = (await session.execute(
+                select(Discounts).where(
+                    Discounts.active == True))).scalars().all()  # noqa: E712
+            usages = (await session.execute(
+                select(DiscountUsage.discount_id,
+                       DiscountUsage.user_id))).all()
+
+    ACTIVE_DISCOUNTS.clear()
+    USED_DISCOUNTS.clear()
+    for discount in discounts:
+        _track_discount(discount)
+    for discount_id, user_id in usages:
+        _track_discount_usage(discount_id, user_id)
+    logger.info(
+        f"Loaded {len(ACTIVE_DISCOUNTS)} active discounts and usage for {len(USED_DISCOUNTS)} users"
+    )
+    return len(ACTIVE_DISCOUNTS)
+
+
 async def create_discount(code: str,
                           discount_type: str,
                           discount_value: int,
@@ -107,6 +157,7 @@ async def create_discount(code: str,
 
                 session.add(new_discount)
                 await session.commit()
+                _track_discount(new_discount)
                 logger.info(f"Discount saved with code={code}")
                 return new_discount
 
@@ -130,6 +181,7 @@ async def change_discount_status(code: str,
 
                 discount.active = active
                 await session.commit()
+                _track_discount(discount)
                 return discount
 
             except SQLAlchemyError as e:
@@ -139,17 +191,7 @@ async def change_discount_status(code: str,
 
 
 async def get_act_discount() -> Optional[List[Discounts]]:
-    async with async_session() as session:
-        async with session.begin():
-            try:
-                result = await session.execute(
-                    select(Discounts).where(
-                        Discounts.active == True)  # noqa: E712
-                )
-                return result.scalars().all()
-            except SQLAlchemyError as e:
-                logger.error(f"Failed to check active discount: {e}")
-                return None
+    return _current_discounts()
 
 
 async def get_discount(discount_code: str) -> Optional[Discounts]:
@@ -169,6 +211,8 @@ Actual error: {sqex}')
 
 
 async def get_discount_by_id(discount_id: int) -> Optional[Discounts]:
+    # Pre-checkout validates with this, so it reads the primary rather than
+    # ACTIVE_DISCOUNTS or a replica that may lag behind the latest use.
     try:
         async with async_session() as session:
             async with session.begin():
@@ -183,107 +227,118 @@ Actual error: {sqex}')
         return None
 
 
-async def get_active_discount(user_id: int) -> List[Discounts]:
-    async with async_session() as session:
-        async with session.begin():
-            try:
-                now = datetime.now(timezone.utc).timestamp()
-
-                result = await session.execute(
-                    select(Discounts).where(
-                        Discounts.active == True,  # noqa: E712
-                        (Discounts.expiry_time == None) |  # noqa: E711
-                        (Discounts.expiry_time > now),
-                        (Discounts.max_uses == None) |  # noqa: E711
-                        (Discounts.usage_count < Discounts.max_uses)))
-                active_discounts = result.scalars().all()
-                active_available_discounts = []
-
-                for active_discount in active_discounts:
-                    used_discount = await session.execute(
-                        select(DiscountUsage).where(
-                            DiscountUsage.discount_id == active_discount.id,
-                            DiscountUsage.user_id == user_id))
-                    if not used_discount.scalar_one_or_none():
-                        active_available_discounts.append(active_discount)
-
-                return active_available_discounts
-
-            except SQLAlchemyError as e:
-                logger.error(
-                    f"Failed to check active discount for user {user_id}: {e}")
-                return None
-
-
-async def update_discount_usage(discount_code: str) -> Optional[Discounts]:
-    async with async_session() as session:
-        async with session.begin():
-            try:
-                result = await session.execute(
-                    select(Discounts).where(
-                        Discounts.code == discount_code,
-                        Discounts.active == True)  # noqa: E712
-                )
-                discount = result.scalar_one_or_none()
+async def get_active_discount(
+        user_id: int,
+        session: Optional[AsyncSession] = None) -> List[Discounts]:
+    # Payments pass their session and check against the database itself, so
+    # a discount that just ran out of uses is not applied twice.
+    if session is None:
+        used_discounts = USED_DISCOUNTS.get(user_id, ())
+        return [
+            discount for discount in _current_discounts()
+            if discount.id not in used_discounts and (
+                discount.max_uses is None
+                or discount.usage_count < discount.max_uses)
+        ]
 
-                if discount:
-                    discount.usage_count += 1
-                    await session.commit()
-                    logger.info(
-                        f"Updated usage count for discount '{discount_code}' to {discount.usage_count}"
-                    )
-                    return discount
+    try:
+        async with session_scope(session) as db_session:
+            now = datetime.now(timezone.utc).timestamp()
+
+            result = await db_session.execute(
+                select(Discounts).where(
+                    Discounts.active == True,  # noqa: E712
+                    (Discounts.expiry_time == None) |  # noqa: E711
+                    (Discounts.expiry_time > now),
+                    (Discounts.max_uses == None) |  # noqa: E711
+                    (Discounts.usage_count < Discounts.max_uses),
+                    ~exists().where(
+                        DiscountUsage.discount_id == Discounts.id,
+                        DiscountUsage.user_id == user_id)).order_by(
+                            Discounts.id))
+            return result.scalars().all()
+
+    except SQLAlchemyError as e:
+        logger.error(
+            f"Failed to check active discount for user {user_id}: {e}")
+        if session is not None:
+            raise
+        return None
 
-                return None
 
-            except SQLAlchemyError as e:
-                logger.error(
-                    f"Failed to update usage count for discount '{discount_code}': {e}"
+async def update_discount_usage(
+        discount_code: str,
+        session: Optional[AsyncSession] = None) -> Optional[Discounts]:
+    try:
+        async with session_scope(session) as db_session:
+            usage_count = await atomic_increment(
+                db_session,
+                Discounts.usage_count,
+                1,
+                Discounts.code == discount_code,
+                Discounts.active == True,  # noqa: E712
+                # Payments that both passed get_active_discount() can't take
+                # it past max_uses.
+                only_if=(Discounts.max_uses == None)  # noqa: E711
+                | (Discounts.usage_count < Discounts.max_uses),
+            )
+
+            # The row may already be in this session's identity map with the
+            # count from before the increment, so overwrite it.
+            result = await db_session.execute(
+                select(Discounts).where(
+                    Discounts.code == discount_code).execution_options(
+                        populate_existing=True))
+            discount = result.scalar_one_or_none()
+            if discount is not None:
+                on_commit(db_session, lambda: _track_discount(discount))
+            if usage_count is None:
+                logger.warning(
+                    f"Discount '{discount_code}' is exhausted or inactive, usage not counted"
                 )
-                await session.rollback()
                 return None
+        logger.info(
+            f"Updated usage count for discount '{discount_code}' to {usage_count}"
+        )
+        return discount
+
+    except SQLAlchemyError as e:
+        logger.error(
+            f"Failed to update usage count for discount '{discount_code}': {e}"
+        )
+        if session is not None:
+            raise
+        return None
 
 
-async def save_discount_usage(discount_id: int, user_id: int):
-    async with async_session() as session:
-        async with session.begin():
-            try:
-                discount_usage = DiscountUsage(discount_id=discount_id,
-                                               user_id=user_id)
-                session.add(discount_usage)
-                await session.commit()
-                logger.info(
-                    f"Saved discount usage for discount_id {discount_id} and user_id {user_id}"
-                )
-            except SQLAlchemyError as e:
-                logger.error(f"Failed to save discount usage: {e}")
-                await session.rollback()
-
-
-async def get_discount_usage(discount_id: int,
-                             user_id: int) -> Optional[DiscountUsage]:
-    async with async_session() as session:
-        async with session.begin():
-            try:
-                result = await session.execute(
-                    select(DiscountUsage).where(
-                        DiscountUsage.discount_id == discount_id,
-                        DiscountUsage.user_id == user_id))
-                return result.scalar_one_or_none()
-            except SQLAlchemyError as e:
-                logger.error(f"Failed to check discount usage: {e}")
-                return None
+async def save_discount_usage(discount_id: int,
+                              user_id: int,
+                              session: Optional[AsyncSession] = None):
+    try:
+        async with session_scope(session) as db_session:
+            discount_usage = DiscountUsage(discount_id=discount_id,
+                                           user_id=user_id)
+            db_session.add(discount_usage)
+            await db_session.flush()
+            on_commit(db_session,
+                      lambda: _track_discount_usage(discount_id, user_id))
+        logger.info(
+            f"Saved discount usage for discount_id {discount_id} and user_id {user_id}"
+        )
+    except SQLAlchemyError as e:
+        logger.error(f"Failed to save discount usage: {e}")
+        if session is not None:
+            raise
 
 
 async def get_all_discounts() -> List[Discounts]:
-    async with async_session() as session:
-        async with session.begin():
-            try:
-                result = await session.execute(select(Discounts))
-                return result.scalars().all()
-            except SQLAlchemyError as e:
-                logger.error(f"Failed to fetch all discounts: {e}")
-                return []
+    try:
+        async with session_scope(read_only=True) as session:
+            result = await session.execute(select(Discounts))
+            return result.scalars().all()
+    except SQLAlchemyError as e:
+        logger.error(f"Failed to fetch all discounts: {e}")
+        return []
 
 
 async def delete_discount(code: str) -> bool:
@@ -297,6 +352,7 @@ async def delete_discount(code: str) -> bool:
                 if discount:
                     await session.delete(discount)
                     await session.commit()
+                    ACTIVE_DISCOUNTS.pop(discount.id, None)
                     logger.info(f"Deleted discount with code: {code}")
                     return True
                 else:
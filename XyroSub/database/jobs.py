@@ -0,0 +1,243 @@
+import json
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import (Column, Float, Index, Integer, String, Text, and_,
+                        delete, func, or_, select, update)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from XyroSub import logger
+from XyroSub.database import BASE, on_commit, session_scope, upsert
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Called with a job's kind once it is committed, so local workers can pick it
+# up without waiting for their next poll.
+JOB_LISTENERS: List[Callable[[str], None]] = []
+
+
+class Jobs(BASE):
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True, autoincrement=True, nullable=False)
+    kind = Column(String, nullable=False)
+    # Enqueueing the same key twice is a no-op, whatever state the job is in.
+    key = Column(String, nullable=False, unique=True)
+    payload = Column(Text, nullable=False, default="{}")
+    status = Column(String, nullable=False, default=JOB_PENDING)
+    run_at = Column(Float, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    locked_by = Column(String, nullable=True)
+    lease_until = Column(Float, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(
+        Float, default=lambda: datetime.now(timezone.utc).timestamp())
+    finished_at = Column(Float, nullable=True)
+
+    __table_args__ = (Index('ix_jobs_status_kind_run_at', 'status', 'kind',
+                            'run_at'), )
+
+    def __repr__(self) -> str:
+        return f"<Jobs id={self.id} kind={self.kind} key={self.key} status={self.status} attempts={self.attempts}>"
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        return json.loads(self.payload)
+
+
+def _claimable(now: float):
+    return or_(
+        and_(Jobs.status == JOB_PENDING, Jobs.run_at <= now),
+        and_(Jobs.status == JOB_RUNNING, Jobs.lease_until < now))
+
+
+async def enqueue_job(kind: str,
+                      key: str,
+                      payload: Optional[Dict[str, Any]] = None,
+                      run_at: Optional[float] = None,
+                      session: Optional[AsyncSession] = None) -> bool:
+    """Add a job unless one with ``key`` already exists.
+
+    Inside a unit of work the job commits, or not, with the rest of it.
+    Returns True if the job was new.
+    """
+    try:
+        async with session_scope(session) as db_session:
+            created = await upsert(
+                db_session, Jobs, {
+                    "kind": kind,
+                    "key": key,
+                    "payload": json.dumps(payload or {}),
+                    "status": JOB_PENDING,
+                    "run_at": run_at or datetime.now(timezone.utc).timestamp(),
+                    "attempts": 0,
+                }, ["key"])
+            if created:
+                on_commit(db_session, lambda: _job_enqueued(kind))
+            return bool(created)
+    except SQLAlchemyError as e:
+        logger.error(f"Error enqueueing {kind} job {key}: {e}")
+        if session is not None:
+            raise
+        return False
+
+
+def _job_enqueued(kind: str) -> None:
+    for listener in JOB_LISTENERS:
+        listener(kind)
+
+
+async def claim_jobs(kinds: Sequence[str], worker_id: str, limit: int,
+                     lease_seconds: float) -> List[Jobs]:
+    """Lease up to ``limit`` due jobs of ``kinds`` to ``worker_id``.
+
+    Each candidate is taken with a conditional UPDATE, so workers in other
+    processes racing for the same job can't both win it, on any dialect.
+    Jobs whose lease ran out, e.g. because their worker died, are due again.
+    """
+    now = datetime.now(timezone.utc).timestamp()
+    claimed: List[Jobs] = []
+    try:
+        async with session_scope() as session:
+            candidates = (await session.execute(
+                select(Jobs.id).where(Jobs.kind.in_(kinds),
+                                      _claimable(now)).order_by(
+                                          Jobs.run_at).limit(limit))
+                          ).scalars().all()
+            for job_id in candidates:
+                result = await session.execute(
+                    update(Jobs).where(Jobs.id == job_id,
+                                       _claimable(now)).values(
+                                           status=JOB_RUNNING,
+                                           locked_by=worker_id,
+                                           lease_until=now + lease_seconds,
+                                           attempts=Jobs.attempts + 1).
+                    execution_options(synchronize_session=False))
+                if result.rowcount:
+                    claimed.append(job_id)
+            if claimed:
+                claimed = (await session.execute(
+                    select(Jobs).where(Jobs.id.in_(claimed)).order_by(
+                        Jobs.run_at))).scalars().all()
+    except SQLAlchemyError as e:
+        logger.error(f"Error claiming {', '.join(kinds)} jobs: {e}")
+        return []
+    return list(claimed)
+
+
+async def complete_job(job_id: int, worker_id: str) -> bool:
+    try:
+        async with session_scope() as session:
+            result = await session.execute(
+                update(Jobs).where(Jobs.id == job_id,
+                                   Jobs.locked_by == worker_id).values(
+                                       status=JOB_DONE,
+                                       lease_until=None,
+                                       finished_at=datetime.now(
+                                           timezone.utc).timestamp()))
+            return bool(result.rowcount)
+    except SQLAlchemyError as e:
+        logger.error(f"Error completing job {job_id}: {e}")
+        return False
+
+
+async def complete_jobs(job_ids: List[int], worker_id: str) -> int:
+    try:
+        async with session_scope() as session:
+            result = await session.execute(
+                update(Jobs).where(Jobs.id.in_(job_ids),
+                                   Jobs.locked_by == worker_id).values(
+                                       status=JOB_DONE,
+                                       lease_until=None,
+                                       finished_at=datetime.now(
+                                           timezone.utc).timestamp()))
+            return result.rowcount
+    except SQLAlchemyError as e:
+        logger.error(f"Error completing {len(job_ids)} jobs: {e}")
+        return 0
+
+
+async def renew_job_leases(job_ids: List[int], worker_id: str,
+                           lease_seconds: float) -> int:
+    """Extend the leases ``worker_id`` still holds on ``job_ids``.
+
+    Returns how many were renewed; a job missing from the count was lost,
+    e.g. to another worker that claimed it after its lease ran out.
+    """
+    try:
+        async with session_scope() as session:
+            result = await session.execute(
+                update(Jobs).where(Jobs.id.in_(job_ids),
+                                   Jobs.status == JOB_RUNNING,
+                                   Jobs.locked_by == worker_id).values(
+                                       lease_until=datetime.now(
+                                           timezone.utc).timestamp() +
+                                       lease_seconds))
+            return result.rowcount
+    except SQLAlchemyError as e:
+        logger.error(f"Error renewing the leases of {len(job_ids)} jobs: {e}")
+        return 0
+
+
+async def retry_job(job_id: int, worker_id: str, error: str,
+                    retry_at: Optional[float]) -> bool:
+    """Put a failed job back in the queue, or fail it for good without ``retry_at``."""
+    values: Dict[str, Any] = {
+        "lease_until": None,
+        "last_error": error[:1000],
+    }
+    if retry_at is None:
+        values.update(status=JOB_FAILED,
+                      finished_at=datetime.now(timezone.utc).timestamp())
+    else:
+        values.update(status=JOB_PENDING, run_at=retry_at)
+    try:
+        async with session_scope() as session:
+            result = await session.execute(
+                update(Jobs).where(Jobs.id == job_id,
+                                   Jobs.locked_by == worker_id).values(values))
+            return bool(result.rowcount)
+    except SQLAlchemyError as e:
+        logger.error(f"Error rescheduling job {job_id}: {e}")
+        return False
+
+
+async def get_next_job_time(kinds: Sequence[str]) -> Optional[float]:
+    try:
+        async with session_scope(read_only=True) as session:
+            pending = (await session.execute(
+                select(func.min(Jobs.run_at)).where(
+                    Jobs.kind.in_(kinds), Jobs.status == JOB_PENDING))
+                       ).scalar()
+            leased = (await session.execute(
+                select(func.min(Jobs.lease_until)).where(
+                    Jobs.kind.in_(kinds), Jobs.status == JOB_RUNNING))
+                      ).scalar()
+    except SQLAlchemyError as e:
+        logger.error(f"Error reading the job queue: {e}")
+        return None
+    return min((when for when in (pending, leased) if when is not None),
+               default=None)
+
+
+async def prune_jobs(finished_before: float) -> int:
+    try:
+        async with session_scope() as session:
+            result = await session.execute(
+                delete(Jobs).where(Jobs.status == JOB_DONE,
+                                   Jobs.finished_at < finished_before))
+            return result.rowcount
+    except SQLAlchemyError as e:
+        logger.error(f"Error pruning finished jobs: {e}")
+        return 0
+
+
+async def get_job_counts() -> Dict[str, int]:
+    async with session_scope(read_only=True) as session:
+        result = await session.execute(
+            select(Jobs.status, func.count()).group_by(Jobs.status))
+        return {status: count for status, count in result.all()}
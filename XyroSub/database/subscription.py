@@ -1,19 +1,15 @@
 from datetime import datetime, timezone
-from typing import List, Optional, Tuple
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
 
 import sqlalchemy
-from sqlalchemy import (BigInteger, Column, Float, Integer, String,
-                        UniqueConstraint, select)
+from cachetools import TTLCache
+from sqlalchemy import (BigInteger, Column, Float, Index, Integer, String,
+                        UniqueConstraint, and_, exists, func, or_, select)
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from XyroSub import SCHEMA, logger
-from XyroSub.database import BASE
-
-engine = create_async_engine(SCHEMA, echo=False)
-async_session = async_sessionmaker(bind=engine,
-                                   autoflush=True,
-                                   expire_on_commit=False)
+from XyroSub import SUBSCRIPTION_CACHE_SIZE, SUBSCRIPTION_CACHE_TTL, logger
+from XyroSub.database import BASE, async_session, on_commit, session_scope
 
 
 class Subscriptions(BASE):
@@ -33,8 +29,15 @@ class Subscriptions(BASE):
     first_time_payment = Column(
         Float, default=lambda: datetime.now(timezone.utc).timestamp())
     affiliate_code = Column(String, nullable=True)
+    last_invoice_date = Column(Float, nullable=True)
 
-    __table_args__ = (UniqueConstraint('short_id', name='_short_id_uc'), )
+    __table_args__ = (
+        UniqueConstraint('short_id', name='_short_id_uc'),
+        Index('ix_subscriptions_user_id_cancel', 'user_id',
+              'cancel_on_next_invoice'),
+        Index('ix_subscriptions_next_invoice_date', 'next_invoice_date', 'id'),
+        Index('ix_subscriptions_transaction_id', 'transaction_id'),
+    )
 
     def __init__(
         self,
@@ -76,78 +79,183 @@ async def save_transaction(
     plan_type: str,
     recurring_interval: int,
     affiliate_code: Optional[str] = None,
+    session: Optional[AsyncSession] = None,
 ):
-    async with async_session() as session:
-        async with session.begin():
-            result = await session.execute(
-                select(Subscriptions).where(
-                    Subscriptions.transaction_id == transaction_id))
-            existing_transaction = result.scalar_one_or_none()
-
-            if existing_transaction:
-                logger.info(f"Transaction {transaction_id} already exists.")
-                return existing_transaction
-
-
-            new_subscription = Subscriptions(
-                transaction_id=transaction_id,
-                short_id=short_id,
-                user_id=user_id,
-                amount=amount,
-                payment_date=payment_date,
-                next_invoice_date=next_invoice_date,
-                plan_type=plan_type,
-                recurring_interval=recurring_interval,
-                first_time_payment=payment_date,
-                affiliate_code=affiliate_code,
-            )
-            session.add(new_subscription)
-            await session.commit()
-            logger.info(
-                f"Transaction saved for transaction_id={transaction_id} user_id={user_id}"
-            )
-            return new_subscription
+    async with session_scope(session) as db_session:
+        result = await db_session.execute(
+            select(Subscriptions).where(
+                Subscriptions.transaction_id == transaction_id))
+        existing_transaction = result.scalar_one_or_none()
+
+        if existing_transaction:
+            logger.info(f"Transaction {transaction_id} already exists.")
+            return existing_transaction
+
+
+        new_subscription = Subscriptions(
+            transaction_id=transaction_id,
+            short_id=short_id,
+            user_id=user_id,
+            amount=amount,
+            payment_date=payment_date,
+            next_invoice_date=next_invoice_date,
+            plan_type=plan_type,
+            recurring_interval=recurring_interval,
+            first_time_payment=payment_date,
+            affiliate_code=affiliate_code,
+        )
+        db_session.add(new_subscription)
+        on_commit(
+            db_session,
+            lambda: _subscription_changed(transaction_id, new_subscription))
+        await db_session.flush()
+    logger.info(
+        f"Transaction saved for transaction_id={transaction_id} user_id={user_id}"
+    )
+    return new_subscription
 
 
 async def get_all_subscriptions() -> List[Subscriptions]:
-    async with async_session() as session:
-        async with session.begin():
-            result = await session.execute(select(Subscriptions))
-            subscriptions = result.scalars().all()
-            logger.info("All subscriptions retrieved")
-            return subscriptions
+    async with session_scope(read_only=True) as session:
+        result = await session.execute(select(Subscriptions))
+        subscriptions = result.scalars().all()
+        logger.info("All subscriptions retrieved")
+        return subscriptions
+
+
+async def get_subscribed_user_ids() -> Set[int]:
+    async with session_scope(read_only=True) as session:
+        result = await session.execute(
+            select(Subscriptions.user_id).distinct())
+        return set(result.scalars().all())
+
+
+async def stream_due_subscriptions(
+        due_before: Optional[float] = None,
+        batch_size: int = 500) -> AsyncIterator[Subscriptions]:
+    last_invoice_date, last_id = None, None
+    while True:
+        async with async_session() as session:
+            async with session.begin():
+                statement = select(Subscriptions)
+                if due_before is not None:
+                    statement = statement.where(
+                        Subscriptions.next_invoice_date <= due_before)
+                if last_id is not None:
+                    statement = statement.where(
+                        or_(
+                            Subscriptions.next_invoice_date
+                            > last_invoice_date,
+                            and_(
+                                Subscriptions.next_invoice_date ==
+                                last_invoice_date,
+                                Subscriptions.id > last_id)))
+                statement = statement.order_by(
+                    Subscriptions.next_invoice_date,
+                    Subscriptions.id).limit(batch_size)
+                batch = (await session.execute(statement)).scalars().all()
+
+        for subscription in batch:
+            yield subscription
+
+        if len(batch) < batch_size:
+            return
+        last_invoice_date, last_id = batch[-1].next_invoice_date, batch[-1].id
+
+
+# Read-through caches for the lookups behind every subscription button. The
+# writers below evict entries once their transaction commits; the TTL bounds
+# anything that slips past them, like a read racing a commit.
+SUBSCRIPTIONS_BY_SHORT_ID: TTLCache = TTLCache(maxsize=SUBSCRIPTION_CACHE_SIZE,
+                                               ttl=SUBSCRIPTION_CACHE_TTL)
+SUBSCRIPTIONS_BY_TRANSACTION_ID: TTLCache = TTLCache(
+    maxsize=SUBSCRIPTION_CACHE_SIZE, ttl=SUBSCRIPTION_CACHE_TTL)
+SUBSCRIPTION_CACHE_STATS: Dict[str, int] = {"hits": 0, "misses": 0}
+
+# Called with the committed subscription whenever one is created or its
+# billing dates or cancellation change, e.g. to move the billing timers.
+SUBSCRIPTION_LISTENERS: List[Callable[[Subscriptions], None]] = []
+
+
+def _cache_subscription(subscription: Subscriptions) -> None:
+    SUBSCRIPTIONS_BY_SHORT_ID[subscription.short_id] = subscription
+    SUBSCRIPTIONS_BY_TRANSACTION_ID[subscription.transaction_id] = subscription
+
+
+def _evict_subscription(transaction_id: str) -> None:
+    SUBSCRIPTIONS_BY_TRANSACTION_ID.pop(transaction_id, None)
+    for short_id, subscription in list(SUBSCRIPTIONS_BY_SHORT_ID.items()):
+        if subscription.transaction_id == transaction_id:
+            SUBSCRIPTIONS_BY_SHORT_ID.pop(short_id, None)
+
+
+def _subscription_changed(transaction_id: str,
+                          subscription: Subscriptions) -> None:
+    _evict_subscription(transaction_id)
+    for listener in SUBSCRIPTION_LISTENERS:
+        listener(subscription)
+
+
+def get_subscription_cache_stats() -> Dict[str, int]:
+    return {
+        **SUBSCRIPTION_CACHE_STATS,
+        "short_id_entries": len(SUBSCRIPTIONS_BY_SHORT_ID),
+        "transaction_id_entries": len(SUBSCRIPTIONS_BY_TRANSACTION_ID),
+    }
 
 
 async def get_transaction(transaction_id: str) -> Optional[Subscriptions]:
+    transaction = SUBSCRIPTIONS_BY_TRANSACTION_ID.get(transaction_id)
+    if transaction is not None:
+        SUBSCRIPTION_CACHE_STATS["hits"] += 1
+        return transaction
+    SUBSCRIPTION_CACHE_STATS["misses"] += 1
+
     async with async_session() as session:
         async with session.begin():
             result = await session.execute(
                 select(Subscriptions).where(
                     Subscriptions.transaction_id == transaction_id))
             transaction = result.scalar_one_or_none()
-            logger.info(
-                f"Transaction retrieved for transaction_id={transaction_id}: {transaction}"
-            )
-            return transaction
+            logger.debug(
+                f"Transaction retrieved for transaction_id={transaction_id}: "
+                f"{'found' if transaction else 'not found'}")
+
+    if transaction is not None:
+        _cache_subscription(transaction)
+    return transaction
 
 
 async def get_transaction_by_short_id(
-        short_id: str) -> Optional[Subscriptions]:
-    async with async_session() as session:
-        async with session.begin():
-            result = await session.execute(
-                select(Subscriptions).where(Subscriptions.short_id == short_id)
-            )
-            transaction = result.scalar_one_or_none()
-            logger.info(
-                f"Transaction retrieved for short_id={short_id}: {transaction}"
-            )
+        short_id: str,
+        session: Optional[AsyncSession] = None) -> Optional[Subscriptions]:
+    # A unit of work reads its own uncommitted state, never the cache.
+    if session is None:
+        transaction = SUBSCRIPTIONS_BY_SHORT_ID.get(short_id)
+        if transaction is not None:
+            SUBSCRIPTION_CACHE_STATS["hits"] += 1
             return transaction
+        SUBSCRIPTION_CACHE_STATS["misses"] += 1
+
+    # Misses read the primary: a replica may still hold the row from before
+    # the write that evicted it, and it would stay cached for the whole TTL.
+    async with session_scope(session) as db_session:
+        result = await db_session.execute(
+            select(Subscriptions).where(Subscriptions.short_id == short_id)
+        )
+        transaction = result.scalar_one_or_none()
+        logger.debug(f"Transaction retrieved for short_id={short_id}: "
+                     f"{'found' if transaction else 'not found'}")
+
+    if transaction is not None and session is None:
+        _cache_subscription(transaction)
+    return transaction
 
 
 async def delete_transaction(transaction_id: str):
     async with async_session() as session:
         async with session.begin():
+            on_commit(session, lambda: _evict_subscription(transaction_id))
             await session.execute(
                 sqlalchemy.delete(Subscriptions).where(
                     Subscriptions.transaction_id == transaction_id))
@@ -156,6 +264,21 @@ async def delete_transaction(transaction_id: str):
                 f"Transaction deleted for transaction_id={transaction_id}")
 
 
+async def mark_invoice_sent(transaction_id: str, sent_at: float):
+    async with async_session() as session:
+        try:
+            async with session.begin():
+                on_commit(session, lambda: _evict_subscription(transaction_id))
+                await session.execute(
+                    sqlalchemy.update(Subscriptions).where(
+                        Subscriptions.transaction_id == transaction_id).values(
+                            last_invoice_date=sent_at))
+        except SQLAlchemyError as e:
+            logger.error(
+                f"Error recording the invoice sent for transaction_id={transaction_id}: {e}"
+            )
+
+
 async def update_next_invoice_date(transaction_id: str,
                                    next_invoice_date: float):
     async with async_session() as session:
@@ -169,6 +292,10 @@ async def update_next_invoice_date(transaction_id: str,
 
                 if subscription:
                     subscription.next_invoice_date = next_invoice_date
+                    on_commit(
+                        session,
+                        lambda: _subscription_changed(transaction_id,
+                                                      subscription))
                     await session.commit()
                     logger.info(
                         f"Updated next invoice date for transaction_id={transaction_id} to next_invoice_date={next_invoice_date}"
@@ -191,6 +318,9 @@ async def mark_for_cancellation(transaction_id: str):
 
             if subscription:
                 subscription.cancel_on_next_invoice = 1
+                on_commit(
+                    session,
+                    lambda: _subscription_changed(transaction_id, subscription))
                 await session.commit()
                 logger.info(
                     f"Marked subscription for cancellation for transaction_id={transaction_id}"
@@ -203,30 +333,35 @@ async def mark_for_cancellation(transaction_id: str):
 
 
 async def update_transaction(existing_transaction_id: str,
-                             new_transaction_id: str, amount: int,
-                             payment_date: float, next_invoice_date: float):
-    async with async_session() as session:
-        async with session.begin():
-            query = (select(Subscriptions).where(
-                Subscriptions.transaction_id ==
-                existing_transaction_id).with_for_update())
-            result = await session.execute(query)
-            subscription = result.scalar_one_or_none()
-
-            if subscription:
-                subscription.transaction_id = new_transaction_id
-                subscription.amount = amount
-                subscription.payment_date = payment_date
-                subscription.next_invoice_date = next_invoice_date
-                await session.commit()
-                logger.info(
-                    f"Updated transaction for existing_transaction_id={existing_transaction_id} with new_transaction_id={new_transaction_id}"
-                )
-            else:
-                logger.error(
-                    f"Subscription not found for existing_transaction_id={existing_transaction_id}"
-                )
-                return None
+                             new_transaction_id: str,
+                             amount: int,
+                             payment_date: float,
+                             next_invoice_date: float,
+                             session: Optional[AsyncSession] = None):
+    async with session_scope(session) as db_session:
+        query = (select(Subscriptions).where(
+            Subscriptions.transaction_id ==
+            existing_transaction_id).with_for_update())
+        result = await db_session.execute(query)
+        subscription = result.scalar_one_or_none()
+
+        if subscription:
+            subscription.transaction_id = new_transaction_id
+            subscription.amount = amount
+            subscription.payment_date = payment_date
+            subscription.next_invoice_date = next_invoice_date
+            on_commit(
+                db_session, lambda: _subscription_changed(
+                    existing_transaction_id, subscription))
+            await db_session.flush()
+            logger.info(
+                f"Updated transaction for existing_transaction_id={existing_transaction_id} with new_transaction_id={new_transaction_id}"
+            )
+        else:
+            logger.error(
+                f"Subscription not found for existing_transaction_id={existing_transaction_id}"
+            )
+            return None
 
 
 async def update_cancel_on_next_invoice(transaction_id: str,
@@ -241,6 +376,9 @@ async def update_cancel_on_next_invoice(transaction_id: str,
 
             if subscription:
                 subscription.cancel_on_next_invoice = cancel_on_next_invoice
+                on_commit(
+                    session,
+                    lambda: _subscription_changed(transaction_id, subscription))
                 await session.commit()
                 logger.info(
                     f"Updated cancel_on_next_invoice for transaction_id={transaction_id} to cancel_on_next_invoice={cancel_on_next_invoice}"
@@ -252,19 +390,33 @@ async def update_cancel_on_next_invoice(transaction_id: str,
                 return None
 
 
-async def get_all_transactions_user(
-        user_id: int) -> List[Tuple[Subscriptions]]:
+async def get_user_subscriptions(user_id: int) -> List[Subscriptions]:
     async with async_session() as session:
         async with session.begin():
             statement = select(Subscriptions).where(
-                Subscriptions.user_id == user_id)
+                Subscriptions.user_id == user_id).order_by(Subscriptions.id)
             results = await session.execute(statement)
-            return results.all()
+            return results.scalars().all()
+
+
+async def count_user_subscriptions(user_id: int,
+                                   active_only: bool = False) -> int:
+    async with async_session() as session:
+        async with session.begin():
+            statement = select(func.count()).select_from(Subscriptions).where(
+                Subscriptions.user_id == user_id)
+            if active_only:
+                statement = statement.where(
+                    Subscriptions.cancel_on_next_invoice == 0)
+            return (await session.execute(statement)).scalar_one()
+
 
 async def has_active_subscription(user_id: int) -> bool:
-    subscriptions = await get_all_subscriptions()
-    user_subscriptions = [
-        sub for sub in subscriptions if sub.user_id == user_id
-    ]
-    return any(sub for sub in user_subscriptions if sub.cancel_on_next_invoice == 0)
+    async with async_session() as session:
+        async with session.begin():
+            statement = select(
+                exists().where(Subscriptions.user_id == user_id,
+                               Subscriptions.cancel_on_next_invoice == 0))
+            return bool((await session.execute(statement)).scalar())
+
 
@@ -1,17 +1,37 @@
+import asyncio
 import datetime
-from typing import List, Optional, Tuple
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
 
 from sqlalchemy import (BigInteger, Boolean, Column, Float, Integer, String,
-                        and_, select)
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+                        delete, insert, select, update)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from XyroSub import SCHEMA, logger
-from XyroSub.database import BASE
+from XyroSub import BLACKLIST_REFRESH_INTERVAL, logger
+from XyroSub.database import BASE, async_session, session_scope, upsert
 
-engine = create_async_engine(SCHEMA, echo=False)
-async_session = async_sessionmaker(bind=engine,
-                                   autoflush=True,
-                                   expire_on_commit=False)
+# Mirror of blacklisted user ids, loaded by load_blacklist() at startup, kept
+# current by set_blacklist_status() and reloaded by refresh_blacklist() for
+# changes made by other processes.
+BLACKLISTED_USERS: Set[int] = set()
+
+# Every user id the bot has registered, loaded by load_known_users(). New ids
+# wait in PENDING_USERS with their first_seen time until flush_new_users()
+# inserts them together.
+KNOWN_USERS: Set[int] = set()
+PENDING_USERS: Dict[int, float] = {}
+USER_FLUSH_DELAY = 0.25
+USER_FLUSH_MAX_DELAY = 30.0
+_user_flush_task: Optional[asyncio.Task] = None
+
+# Unclaimed premium channel invite links as (invite_link, expire_date), oldest
+# first. Loaded by load_invite_link_pool() and mirrored in invite_link_pool.
+INVITE_LINK_POOL: Deque[Tuple[str, float]] = deque()
+
+# Mirror of the premium channel's members, loaded by load_premium_members() and
+# kept current from chat member updates.
+PREMIUM_MEMBERS: Set[int] = set()
 
 
 class Users(BASE):
@@ -56,49 +76,151 @@ class InviteLink(BASE):
 
     def __repr__(self):
         return f"<InviteLink user_id={self.user_id}, link={self.invite_link}>"
-    
-async def create_user(user_id: int):
+
+
+class PooledInviteLink(BASE):
+    __tablename__ = 'invite_link_pool'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    invite_link = Column(String, nullable=False, unique=True)
+    expire_date = Column(Float, nullable=False)
+
+    def __init__(self, invite_link: str, expire_date: float):
+        self.invite_link = invite_link
+        self.expire_date = expire_date
+
+    def __repr__(self):
+        return f"<PooledInviteLink link={self.invite_link}, expire_date={self.expire_date}>"
+
+
+class PremiumMember(BASE):
+    __tablename__ = 'premium_members'
+
+    user_id = Column(BigInteger, primary_key=True, nullable=False)
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+
+    def __repr__(self):
+        return f"<PremiumMember user_id={self.user_id}>"
+
+
+async def load_known_users() -> int:
     async with async_session() as session:
         async with session.begin():
-            result = await session.execute(
-                select(Users).where(
-                    and_(Users.user_id == user_id)))
-            existing_user = result.scalar_one_or_none()
-
-            if existing_user:
-                logger.info(
-                    f"User {user_id} already exists in chat")
-                return existing_user
-
-            new_user = Users(user_id=user_id)
-            session.add(new_user)
-            await session.commit()
-            logger.info(
-                f"User created for user_id={user_id}")
-            return new_user
+            result = await session.execute(select(Users.user_id))
+            user_ids = set(result.scalars().all())
+
+    KNOWN_USERS.clear()
+    KNOWN_USERS.update(user_ids)
+    KNOWN_USERS.update(PENDING_USERS)
+    logger.info(f"Loaded {len(KNOWN_USERS)} known users")
+    return len(KNOWN_USERS)
+
+
+async def create_user(user_id: int) -> bool:
+    """Register ``user_id`` if the bot hasn't seen it before.
+
+    Known users cost a set lookup. New ones are written behind, batched with
+    the other users that arrive within USER_FLUSH_DELAY.
+    """
+    global _user_flush_task
+
+    if user_id in KNOWN_USERS:
+        return False
+
+    KNOWN_USERS.add(user_id)
+    PENDING_USERS[user_id] = datetime.datetime.now(
+        datetime.timezone.utc).timestamp()
+    if _user_flush_task is None or _user_flush_task.done():
+        _user_flush_task = asyncio.create_task(_flush_new_users_later())
+    return True
+
+
+async def _flush_new_users_later():
+    delay = USER_FLUSH_DELAY
+    while PENDING_USERS:
+        await asyncio.sleep(delay)
+        flushed = await flush_new_users()
+        # Back off while the database keeps failing.
+        delay = USER_FLUSH_DELAY if flushed else min(delay * 2,
+                                                     USER_FLUSH_MAX_DELAY)
+
+
+async def flush_new_users() -> bool:
+    if not PENDING_USERS:
+        return True
+
+    pending = dict(PENDING_USERS)
+    PENDING_USERS.clear()
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                created = await upsert(session, Users, [{
+                    "user_id": user_id,
+                    "first_seen": first_seen
+                } for user_id, first_seen in pending.items()], ["user_id"])
+    except SQLAlchemyError as e:
+        logger.error(f"Error registering {len(pending)} new users: {e}")
+        for user_id, first_seen in pending.items():
+            PENDING_USERS.setdefault(user_id, first_seen)
+        return False
+
+    logger.info(f"Registered {created} new users")
+    return True
 
 
 async def set_blacklist_status(user_id: int, status: bool):
     async with async_session() as session:
         async with session.begin():
-            query = await session.execute(
-                select(Blacklist).where(Blacklist.user_id == user_id))
-            entry = query.scalar_one_or_none()
-            if entry:
-                entry.blacklisted = status
-            else:
-                new_entry = Blacklist(user_id=user_id, blacklisted=status)
-                session.add(new_entry)
-            await session.commit()
+            await upsert(session,
+                         Blacklist, {
+                             "user_id": user_id,
+                             "blacklisted": status
+                         }, ["user_id"],
+                         update_columns=["blacklisted"])
+
+    if status:
+        BLACKLISTED_USERS.add(user_id)
+    else:
+        BLACKLISTED_USERS.discard(user_id)
 
 
-async def is_user_blacklisted(user_id: int) -> bool:
+async def _read_blacklist() -> Set[int]:
     async with async_session() as session:
         async with session.begin():
             result = await session.execute(
-                select(Blacklist).where(Blacklist.user_id == user_id))
-            entry = result.scalar_one_or_none()
-            return entry.blacklisted if entry else False
+                select(Blacklist.user_id).where(
+                    Blacklist.blacklisted == True))  # noqa: E712
+            return set(result.scalars().all())
+
+
+async def load_blacklist() -> int:
+    user_ids = await _read_blacklist()
+    BLACKLISTED_USERS.clear()
+    BLACKLISTED_USERS.update(user_ids)
+    logger.info(f"Loaded {len(BLACKLISTED_USERS)} blacklisted users")
+    return len(BLACKLISTED_USERS)
+
+
+async def refresh_blacklist() -> None:
+    while True:
+        await asyncio.sleep(BLACKLIST_REFRESH_INTERVAL)
+        try:
+            user_ids = await _read_blacklist()
+        except SQLAlchemyError as e:
+            logger.error(f"Error reloading the blacklist: {e}")
+            continue
+        if user_ids != BLACKLISTED_USERS:
+            logger.info(
+                f"Blacklist reloaded, {len(user_ids - BLACKLISTED_USERS)} added and {len(BLACKLISTED_USERS - user_ids)} removed"
+            )
+            BLACKLISTED_USERS.clear()
+            BLACKLISTED_USERS.update(user_ids)
+
+
+def is_user_blacklisted(user_id: int) -> bool:
+    return user_id in BLACKLISTED_USERS
 
 
 async def check_refund_eligibility(user_id: int) -> bool:
@@ -115,24 +237,23 @@ async def check_refund_eligibility(user_id: int) -> bool:
 
 
 async def mark_refund_used(user_id: int) -> bool:
+    """Use up ``user_id``'s one refund, False if it was already used."""
     async with async_session() as session:
         async with session.begin():
-            query = await session.execute(
-                select(Blacklist).where(Blacklist.user_id == user_id))
-            entry = query.scalar_one_or_none()
-
-            if entry:
-                if entry.refund_used:
-                    return False
-
-                entry.refund_used = True
-                await session.commit()
-                return True
-
-            new_entry = Blacklist(user_id=user_id, refund_used=True)
-            session.add(new_entry)
-            await session.commit()
-            return True
+            # Make sure the row exists, then flip the flag with a conditional
+            # UPDATE. Its rowcount only counts a real change, unlike an
+            # upsert's on MySQL.
+            await upsert(session, Blacklist, {
+                "user_id": user_id,
+                "blacklisted": False,
+                "refund_used": False
+            }, ["user_id"])
+            result = await session.execute(
+                update(Blacklist).where(
+                    Blacklist.user_id == user_id,
+                    Blacklist.refund_used == False).values(  # noqa: E712
+                        refund_used=True))
+            return result.rowcount == 1
 
 
 async def get_users_info_user(user_id: int) -> List[Tuple[Users]]:
@@ -145,17 +266,13 @@ async def get_users_info_user(user_id: int) -> List[Tuple[Users]]:
 async def create_invite_link(user_id: int, invite_link: str):
     async with async_session() as session:
         async with session.begin():
-            existing_entry = await session.get(InviteLink, user_id)
-            
-            if existing_entry:
-                existing_entry.invite_link = invite_link
-                logger.info(f"Invite link updated for user_id={user_id}")
-            else:
-                invite_entry = InviteLink(user_id=user_id, invite_link=invite_link)
-                session.add(invite_entry)
-                logger.info(f"Invite link created for user_id={user_id}")
-
-            await session.commit()
+            await upsert(session,
+                         InviteLink, {
+                             "user_id": user_id,
+                             "invite_link": invite_link
+                         }, ["user_id"],
+                         update_columns=["invite_link"])
+            logger.info(f"Invite link saved for user_id={user_id}")
 
 async def get_invite_link(user_id: int) -> Optional[InviteLink]:
     async with async_session() as session:
@@ -163,15 +280,154 @@ async def get_invite_link(user_id: int) -> Optional[InviteLink]:
             result = await session.execute(select(InviteLink).where(InviteLink.user_id == user_id))
             return result.scalar_one_or_none()
 
-async def delete_invite_link(user_id: int) -> bool:
+
+async def delete_invite_links(
+        invite_links: List[str],
+        session: Optional[AsyncSession] = None) -> int:
+    """Delete the rows of ``invite_links`` together.
+
+    Matching on the links rather than the users leaves alone a link saved
+    for one of them since, e.g. after paying again.
+    """
+    async with session_scope(session) as db_session:
+        result = await db_session.execute(
+            delete(InviteLink).where(InviteLink.invite_link.in_(invite_links)))
+        return result.rowcount
+
+
+async def load_invite_link_pool() -> int:
     async with async_session() as session:
         async with session.begin():
-            query = await session.execute(select(InviteLink).where(InviteLink.user_id == user_id))
-            invite_entry = query.scalar_one_or_none()
-
-            if invite_entry:
-                await session.delete(invite_entry)
-                await session.commit()
-                logger.info(f"Invite link deleted for user_id={user_id}")
-                return True
-            return False
+            result = await session.execute(
+                select(PooledInviteLink.invite_link,
+                       PooledInviteLink.expire_date).order_by(
+                           PooledInviteLink.expire_date))
+            links = [tuple(row) for row in result.all()]
+
+    INVITE_LINK_POOL.clear()
+    INVITE_LINK_POOL.extend(links)
+    logger.info(f"Loaded {len(INVITE_LINK_POOL)} pooled invite links")
+    return len(INVITE_LINK_POOL)
+
+
+async def add_pooled_invite_links(links: List[Tuple[str, float]]) -> bool:
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                session.add_all([
+                    PooledInviteLink(invite_link, expire_date)
+                    for invite_link, expire_date in links
+                ])
+    except SQLAlchemyError as e:
+        logger.error(f"Error saving {len(links)} pooled invite links: {e}")
+        return False
+
+    INVITE_LINK_POOL.extend(sorted(links, key=lambda link: link[1]))
+    return True
+
+
+async def claim_pooled_invite_link(valid_until: float) -> Optional[str]:
+    """Take the oldest pooled link that stays valid until ``valid_until``.
+
+    Links expiring before that are skipped but left in the pool, so
+    pop_stale_pooled_invite_links() can still revoke them. A link only
+    counts as claimed once this process deleted its row; other bot processes
+    share the table, and one that got there first has handed it out.
+    """
+    while True:
+        for index, (invite_link, expire_date) in enumerate(INVITE_LINK_POOL):
+            if expire_date >= valid_until:
+                del INVITE_LINK_POOL[index]
+                break
+        else:
+            return None
+
+        try:
+            async with async_session() as session:
+                async with session.begin():
+                    result = await session.execute(
+                        delete(PooledInviteLink).where(
+                            PooledInviteLink.invite_link == invite_link))
+        except SQLAlchemyError as e:
+            logger.error(
+                f"Error removing claimed invite link {invite_link}: {e}")
+            return None
+        if result.rowcount == 1:
+            return invite_link
+
+
+async def pop_stale_pooled_invite_links(
+        valid_until: float) -> List[Tuple[str, float]]:
+    stale: List[Tuple[str, float]] = []
+    while INVITE_LINK_POOL and INVITE_LINK_POOL[0][1] < valid_until:
+        stale.append(INVITE_LINK_POOL.popleft())
+    if not stale:
+        return stale
+
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(
+                    delete(PooledInviteLink).where(
+                        PooledInviteLink.invite_link.in_(
+                            [invite_link for invite_link, _ in stale])))
+    except SQLAlchemyError as e:
+        logger.error(f"Error removing {len(stale)} stale invite links: {e}")
+    return stale
+
+
+async def load_premium_members() -> int:
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(select(PremiumMember.user_id))
+            user_ids = set(result.scalars().all())
+
+    PREMIUM_MEMBERS.clear()
+    PREMIUM_MEMBERS.update(user_ids)
+    logger.info(f"Loaded {len(PREMIUM_MEMBERS)} premium channel members")
+    return len(PREMIUM_MEMBERS)
+
+
+async def set_premium_member(user_id: int, is_member: bool) -> bool:
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                if is_member:
+                    await upsert(session, PremiumMember, {"user_id": user_id},
+                                 ["user_id"])
+                else:
+                    await session.execute(
+                        delete(PremiumMember).where(
+                            PremiumMember.user_id == user_id))
+    except SQLAlchemyError as e:
+        logger.error(
+            f"Error updating premium channel membership of user {user_id}: {e}")
+        return False
+
+    if is_member:
+        PREMIUM_MEMBERS.add(user_id)
+    else:
+        PREMIUM_MEMBERS.discard(user_id)
+    return True
+
+
+async def replace_premium_members(user_ids: Set[int]) -> bool:
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(delete(PremiumMember))
+                if user_ids:
+                    await session.execute(
+                        insert(PremiumMember),
+                        [{"user_id": user_id} for user_id in user_ids])
+    except SQLAlchemyError as e:
+        logger.error(f"Error saving {len(user_ids)} premium channel members: {e}")
+        return False
+
+    PREMIUM_MEMBERS.clear()
+    PREMIUM_MEMBERS.update(user_ids)
+    return True
+
+
+def is_premium_member(user_id: int) -> bool:
+    return user_id in PREMIUM_MEMBERS
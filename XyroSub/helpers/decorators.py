@@ -39,7 +39,7 @@ def check_blacklist():
 
         async def wrapper(client: Client, message: Message):
             user_id = message.from_user.id
-            if await is_user_blacklisted(user_id):
+            if is_user_blacklisted(user_id):
                 await message.reply_text(
                     "You are blacklisted from using this bot.",
                     reply_to_message_id=message.id,
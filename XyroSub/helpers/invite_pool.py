@@ -0,0 +1,121 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+from pyrogram.client import Client
+from pyrogram.errors import FloodWait, RPCError
+
+from XyroSub import (INVITE_LINK_LIFETIME, INVITE_POOL_SIZE, PREMIUM_CHANNEL,
+                     logger)
+from XyroSub.database.users import (INVITE_LINK_POOL, add_pooled_invite_links,
+                                    claim_pooled_invite_link,
+                                    pop_stale_pooled_invite_links)
+
+# A claimed link always has at least half of its lifetime left, one day with
+# the default lifetime, as the links minted on demand used to.
+INVITE_LINK_MIN_VALIDITY = INVITE_LINK_LIFETIME / 2
+INVITE_POOL_CHECK_INTERVAL = 3600
+
+INVITE_POOL_REFILL = asyncio.Event()
+
+
+async def _mint_invite_link(client: Client, lifetime: float) -> Tuple[str, float]:
+    expire_date = time.time() + lifetime
+    invite_link = await client.create_chat_invite_link(
+        chat_id=PREMIUM_CHANNEL,
+        expire_date=datetime.fromtimestamp(expire_date, tz=timezone.utc),
+        member_limit=1)
+    return invite_link.invite_link, expire_date
+
+
+async def get_premium_invite_link(client: Client) -> str:
+    invite_link = await claim_pooled_invite_link(time.time() +
+                                                 INVITE_LINK_MIN_VALIDITY)
+    if len(INVITE_LINK_POOL) < INVITE_POOL_SIZE:
+        INVITE_POOL_REFILL.set()
+    if invite_link:
+        return invite_link
+
+    logger.warning("Invite link pool is empty, minting a link on demand")
+    invite_link, _ = await _mint_invite_link(client, INVITE_LINK_MIN_VALIDITY)
+    return invite_link
+
+
+async def refill_invite_link_pool(client: Client) -> int:
+    minted: List[Tuple[str, float]] = []
+    flood_wait = 0
+    try:
+        while len(INVITE_LINK_POOL) + len(minted) < INVITE_POOL_SIZE:
+            minted.append(await _mint_invite_link(client, INVITE_LINK_LIFETIME))
+    except FloodWait as e:
+        flood_wait = e.value
+    except RPCError as e:
+        logger.error(f"Error minting premium channel invite links: {e}")
+
+    if minted:
+        await add_pooled_invite_links(minted)
+        logger.info(
+            f"Minted {len(minted)} invite links, {len(INVITE_LINK_POOL)} in pool")
+    if flood_wait:
+        logger.warning(
+            f"FloodWait while minting invite links, retrying in {flood_wait}s")
+        await asyncio.sleep(flood_wait)
+    return len(minted)
+
+
+async def revoke_stale_invite_links(client: Client) -> int:
+    """Drop every pooled link that can no longer be handed out.
+
+    They all leave the pool in one database statement. Links that have not
+    expired yet are revoked so they can't be shared.
+    """
+    now = time.time()
+    stale = await pop_stale_pooled_invite_links(now + INVITE_LINK_MIN_VALIDITY)
+    revoked = 0
+    for invite_link, expire_date in stale:
+        if expire_date <= now:
+            continue
+        while True:
+            try:
+                await client.revoke_chat_invite_link(chat_id=PREMIUM_CHANNEL,
+                                                     invite_link=invite_link)
+                revoked += 1
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+                continue
+            except RPCError as e:
+                logger.error(f"Error revoking invite link {invite_link}: {e}")
+            break
+
+    if stale:
+        logger.info(
+            f"Removed {len(stale)} stale invite links from the pool, revoked {revoked}")
+    return revoked
+
+
+async def maintain_invite_link_pool(client: Client):
+    if INVITE_POOL_SIZE <= 0:
+        return
+
+    await asyncio.sleep(10)
+
+    while True:
+        INVITE_POOL_REFILL.clear()
+        try:
+            await revoke_stale_invite_links(client)
+            await refill_invite_link_pool(client)
+        except Exception as e:
+            logger.error(f"Error maintaining the invite link pool: {e}")
+
+        # Wake up when claims drain the pool or the oldest link turns stale.
+        timeout = INVITE_POOL_CHECK_INTERVAL
+        if INVITE_LINK_POOL:
+            timeout = min(
+                timeout,
+                max(INVITE_LINK_POOL[0][1] - INVITE_LINK_MIN_VALIDITY -
+                    time.time(), 1))
+        try:
+            await asyncio.wait_for(INVITE_POOL_REFILL.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import socket
+import time
+from contextlib import asynccontextmanager
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, List,
+                    Sequence, Set)
+
+from XyroSub import JOB_POLL_INTERVAL, logger
+from XyroSub.database.jobs import (JOB_LISTENERS, Jobs, claim_jobs,
+                                   complete_job, get_next_job_time,
+                                   prune_jobs, renew_job_leases, retry_job)
+from XyroSub.helpers.scheduler import RunStats
+
+# Identifies this process in jobs.locked_by, workers elsewhere share the queue.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+JOB_RETENTION = 7 * 86400
+
+JOB_WORKERS: Dict[str, "JobWorker"] = {}
+
+
+@asynccontextmanager
+async def hold_job_leases(job_ids: List[int],
+                          lease_seconds: float) -> AsyncIterator[None]:
+    """Keep renewing the leases on ``job_ids`` while the body runs.
+
+    A handler stuck behind FloodWaits can take longer than its lease, and
+    without this another worker would claim the job and run it again.
+    """
+
+    async def heartbeat() -> None:
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            renewed = await renew_job_leases(job_ids, WORKER_ID,
+                                             lease_seconds)
+            if renewed < len(job_ids):
+                logger.warning(
+                    f"Renewed {renewed} of {len(job_ids)} job leases, the rest may run twice"
+                )
+
+    task = asyncio.create_task(heartbeat())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+class JobWorker:
+    """Runs jobs of the given kinds from the jobs table.
+
+    Up to ``concurrency`` jobs run at once, each leased for ``lease_seconds``
+    and renewed while it runs, so that a job whose worker died is picked up
+    again. A job that raises is retried with exponential backoff and marked
+    failed after ``max_attempts``. Local enqueues wake the worker at once;
+    jobs added by other processes are found by polling every
+    JOB_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self,
+                 name: str,
+                 kinds: Sequence[str],
+                 concurrency: int = 1,
+                 lease_seconds: float = 300,
+                 max_attempts: int = 8,
+                 retry_delay: float = 30) -> None:
+        self.name = name
+        self.kinds = tuple(kinds)
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._wakeup = asyncio.Event()
+        self._tasks: Set[asyncio.Task] = set()
+        self._in_flight = 0
+        self._last_prune = 0.0
+        self.runs = RunStats(name)
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+        JOB_LISTENERS.append(self._on_enqueued)
+        JOB_WORKERS[name] = self
+
+    def _on_enqueued(self, kind: str) -> None:
+        if kind in self.kinds:
+            self._wakeup.set()
+
+    async def run(self, handler: Callable[[Jobs], Awaitable[Any]]) -> None:
+        while True:
+            self._wakeup.clear()
+            free = self.concurrency - self._in_flight
+            claimed = await claim_jobs(self.kinds, WORKER_ID, free,
+                                       self.lease_seconds) if free else []
+            for job in claimed:
+                self.runs.started(lag=time.time() - job.run_at)
+                self._in_flight += 1
+                task = asyncio.create_task(self._run_job(handler, job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            if not self._in_flight:
+                self.runs.idle()
+
+            # With every slot busy a finishing job wakes us, otherwise sleep
+            # until the next job is due.
+            timeout = JOB_POLL_INTERVAL
+            if len(claimed) < free:
+                next_job = await get_next_job_time(self.kinds)
+                if next_job is not None:
+                    timeout = min(timeout, max(next_job - time.time(), 0.05))
+            await self._prune()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_job(self, handler: Callable[[Jobs], Awaitable[Any]],
+                       job: Jobs) -> None:
+        try:
+            async with hold_job_leases([job.id], self.lease_seconds):
+                await handler(job)
+        except Exception as e:
+            if job.attempts >= self.max_attempts:
+                self.failed += 1
+                logger.error(
+                    f"[{self.name}] Job {job.key} failed for good after {job.attempts} attempts: {e}"
+                )
+                await retry_job(job.id, WORKER_ID, str(e), None)
+            else:
+                self.retried += 1
+                delay = min(self.retry_delay * 2**(job.attempts - 1), 3600)
+                logger.warning(
+                    f"[{self.name}] Job {job.key} failed, retrying in {delay:.0f}s: {e}"
+                )
+                await retry_job(job.id, WORKER_ID, str(e), time.time() + delay)
+        else:
+            self.succeeded += 1
+            await complete_job(job.id, WORKER_ID)
+        finally:
+            self._in_flight -= 1
+            self.runs.finished()
+            self._wakeup.set()
+
+    async def _prune(self) -> None:
+        now = time.time()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        pruned = await prune_jobs(now - JOB_RETENTION)
+        if pruned:
+            logger.info(f"[{self.name}] Pruned {pruned} finished jobs")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "succeeded": self.succeeded,
+            "retried": self.retried,
+            "failed": self.failed,
+            "last_run": self.runs.last_run,
+        }
+
+
+def get_job_worker_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: worker.stats() for name, worker in JOB_WORKERS.items()}
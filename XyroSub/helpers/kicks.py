@@ -0,0 +1,140 @@
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from pyrogram.client import Client
+from pyrogram.errors import BadRequest
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from XyroSub import KICK_CONCURRENCY, PREMIUM_CHANNEL, logger
+from XyroSub.database import session_scope
+from XyroSub.database.affiliate import delete_affiliate_users
+from XyroSub.database.jobs import Jobs, enqueue_job
+from XyroSub.database.users import delete_invite_links, get_invite_link
+from XyroSub.helpers.jobs import JobWorker
+from XyroSub.helpers.ratelimit import TELEGRAM_RATE_LIMITER
+
+# A kicked user is unbanned again this long after the ban, so they can come
+# back by paying again.
+KICK_UNBAN_DELAY = 1.0
+KICK_FLUSH_DELAY = 0.25
+
+KICK_WORKER = JobWorker("kicks", ("kick", "unban"),
+                        concurrency=KICK_CONCURRENCY)
+
+# Kicked users as (user_id, their revoked invite link, kick job key, future),
+# waiting for flush_kicked_users() to clean up their rows together.
+PENDING_KICKS: List[Tuple[int, Optional[str], str, asyncio.Future]] = []
+_kick_flush_task: Optional[asyncio.Task] = None
+
+
+async def queue_kick(user_id: int,
+                     key: str,
+                     session: Optional[AsyncSession] = None) -> bool:
+    """Queue removing ``user_id`` from the premium channel.
+
+    The ban, revoking the user's invite link, the unban and dropping their
+    rows all happen in the kick worker, so the caller doesn't wait for them.
+    Queueing the same ``key`` twice kicks once.
+    """
+    return await enqueue_job("kick",
+                             f"{key}:kick", {"user_id": user_id},
+                             session=session)
+
+
+async def _forget_kicked_user(user_id: int, invite_link: Optional[str],
+                              key: str) -> None:
+    global _kick_flush_task
+
+    future = asyncio.get_running_loop().create_future()
+    PENDING_KICKS.append((user_id, invite_link, key, future))
+    if _kick_flush_task is None or _kick_flush_task.done():
+        _kick_flush_task = asyncio.create_task(_flush_kicked_users_later())
+    return await future
+
+
+async def _flush_kicked_users_later():
+    while PENDING_KICKS:
+        await asyncio.sleep(KICK_FLUSH_DELAY)
+        await flush_kicked_users()
+
+
+async def flush_kicked_users() -> int:
+    """Delete the invite links and referrals of every pending kick and queue
+    their unbans, all in one transaction."""
+    kicks = PENDING_KICKS[:]
+    PENDING_KICKS.clear()
+    if not kicks:
+        return 0
+
+    user_ids = list({user_id for user_id, _, _, _ in kicks})
+    invite_links = [
+        invite_link for _, invite_link, _, _ in kicks if invite_link
+    ]
+    unban_at = time.time() + KICK_UNBAN_DELAY
+    try:
+        async with session_scope() as session:
+            if invite_links:
+                await delete_invite_links(invite_links, session)
+            await delete_affiliate_users(user_ids, session)
+            for user_id, _, key, _ in kicks:
+                await enqueue_job("unban",
+                                  f"{key}:unban", {"user_id": user_id},
+                                  run_at=unban_at,
+                                  session=session)
+    except SQLAlchemyError as e:
+        logger.error(f"Error cleaning up after {len(kicks)} kicks: {e}")
+        for _, _, _, future in kicks:
+            if not future.done():
+                future.set_exception(e)
+        return 0
+
+    for _, _, _, future in kicks:
+        if not future.done():
+            future.set_result(None)
+    logger.info(
+        f"Cleaned up after {len(kicks)} kicks, {len(invite_links)} invite links"
+    )
+    return len(kicks)
+
+
+async def handle_kick_job(client: Client, job: Jobs):
+    """Ban, revoke, then delete the rows and queue the unban.
+
+    Every step can be repeated, so a retry after any failure finishes the
+    kick. The invite link's row goes last, a retry still finds the link to
+    revoke.
+    """
+    user_id = job.data["user_id"]
+    if job.kind == "unban":
+        await TELEGRAM_RATE_LIMITER.call(None, client.unban_chat_member,
+                                         chat_id=PREMIUM_CHANNEL,
+                                         user_id=user_id)
+        return
+
+    try:
+        await TELEGRAM_RATE_LIMITER.call(None, client.ban_chat_member,
+                                         chat_id=PREMIUM_CHANNEL,
+                                         user_id=user_id)
+    except BadRequest as e:
+        logger.warning(f"Could not ban {user_id} from the premium channel: {e}")
+
+    invite_link = await get_invite_link(user_id)
+    if invite_link:
+        invite_link = invite_link.invite_link
+        try:
+            await TELEGRAM_RATE_LIMITER.call(None,
+                                             client.revoke_chat_invite_link,
+                                             chat_id=PREMIUM_CHANNEL,
+                                             invite_link=invite_link)
+        except BadRequest as e:
+            # Already revoked or expired.
+            logger.warning(f"Could not revoke invite link {invite_link}: {e}")
+
+    await _forget_kicked_user(user_id, invite_link, job.key)
+
+
+async def process_kicks(client: Client):
+    await asyncio.sleep(10)
+    await KICK_WORKER.run(lambda job: handle_kick_job(client, job))
@@ -0,0 +1,56 @@
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Hashable
+
+KEYED_LOCKS: Dict[str, "KeyedLock"] = {}
+
+
+class KeyedLock:
+    """One asyncio.Lock per key, created on demand.
+
+    Locks are held in a WeakValueDictionary, so a key's lock disappears as
+    soon as nobody holds or waits on it.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary(
+        )
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        KEYED_LOCKS[name] = self
+
+    @asynccontextmanager
+    async def __call__(self, key: Hashable) -> AsyncIterator[None]:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+
+        if lock.locked():
+            self.contended += 1
+        started = time.monotonic()
+        async with lock:
+            waited = time.monotonic() - started
+            self.acquisitions += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            yield
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._locks),
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "avg_wait_ms": (self.total_wait / self.acquisitions *
+                            1000) if self.acquisitions else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+def get_lock_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: lock.stats() for name, lock in KEYED_LOCKS.items()}
@@ -0,0 +1,197 @@
+import asyncio
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from pyrogram.client import Client
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from XyroSub import (ADMIN_DIGEST_INTERVAL, ADMIN_DIGEST_SIZE,
+                     ADMIN_MESSAGES_PER_MINUTE, GROUP_ID, TOPIC_ID, logger)
+from XyroSub.database.jobs import (JOB_LISTENERS, Jobs, claim_jobs,
+                                   complete_jobs, enqueue_job)
+from XyroSub.helpers.jobs import WORKER_ID, hold_job_leases
+from XyroSub.helpers.ratelimit import RateLimiter
+
+ADMIN_DIGEST_KIND = "admin_digest"
+ADMIN_DIGEST_LEASE = 300
+# Telegram caps messages at 4096 characters, leave room for the markup.
+ADMIN_DIGEST_MAX_LENGTH = 3500
+
+# Posts to the admin group get their own lane, so a busy digest doesn't hold
+# up invoices and replies to users, and the other way round.
+ADMIN_RATE_LIMITER = RateLimiter("admin", ADMIN_MESSAGES_PER_MINUTE / 60)
+
+ADMIN_DIGEST_READY = asyncio.Event()
+_pending_digest_entries = 0
+
+
+class AdminDigest:
+    """How one category of routine notifications is summed up in a digest.
+
+    Each entry becomes a ``row``. Tables put the rows in a monospaced block
+    under ``table_header``, and ``summarize`` adds a count of entries per
+    value of that field on top.
+    """
+
+    def __init__(self,
+                 title: str,
+                 row: str,
+                 table_header: Optional[str] = None,
+                 summarize: Optional[str] = None) -> None:
+        self.title = title
+        self.row = row
+        self.table_header = table_header
+        self.summarize = summarize
+
+    def render(self, entries: List[Dict[str, Any]]) -> List[str]:
+        header = f"{self.title} ({len(entries)})\n\n"
+        if self.summarize:
+            counts = Counter(entry[self.summarize] for entry in entries)
+            header += "".join(f"• {value}: {count}\n"
+                              for value, count in counts.most_common())
+            header += "\n"
+
+        messages: List[str] = []
+        chunk: List[str] = []
+        length = len(header)
+        for entry in entries:
+            row = self.row.format(**entry)
+            if chunk and length + len(row) >= ADMIN_DIGEST_MAX_LENGTH:
+                messages.append(self._message(header, chunk))
+                chunk, length = [], len(header)
+            chunk.append(row)
+            length += len(row) + 1
+        if chunk:
+            messages.append(self._message(header, chunk))
+        return messages
+
+    def _message(self, header: str, rows: List[str]) -> str:
+        if self.table_header is None:
+            return header + "\n".join(rows)
+        return header + "<pre>" + "\n".join([self.table_header] +
+                                            rows) + "</pre>"
+
+
+ADMIN_DIGESTS: Dict[str, AdminDigest] = {
+    "invoice":
+    AdminDigest(
+        "🔄 <b>Recurring Invoices Sent</b>",
+        "• {user_id} · {short_id} · {amount} XTR · next invoice {next_invoice_date}"
+    ),
+    "renewal":
+    AdminDigest(
+        "🔄 <b>Subscriptions Renewed</b>",
+        "• {user_id} · {short_id} · {plan_type} · {amount} XTR · next invoice {next_invoice_date}"
+    ),
+    "cancellation":
+    AdminDigest("📭 <b>Subscriptions Marked for Cancellation</b>",
+                "• {user_id} · {short_id}"),
+    "extension":
+    AdminDigest(
+        "⏳ <b>Subscriptions Extended</b>",
+        "• {user_id} · {short_id} · +{months} month(s) · next invoice {next_invoice_date}"
+    ),
+    "kick":
+    AdminDigest("🚫 <b>Users Kicked from Premium Channel</b>",
+                "{user_id:<14} {reason}",
+                table_header=f"{'User ID':<14} Reason",
+                summarize="reason"),
+}
+
+
+def notify_admins(client: Client, text: str, **kwargs) -> asyncio.Task:
+    """Post ``text`` to the admin group now, without waiting for the send."""
+    return ADMIN_RATE_LIMITER.call_soon(GROUP_ID, client.send_message,
+                                        GROUP_ID, text, **kwargs)
+
+
+async def queue_admin_digest(category: str,
+                             key: str,
+                             session: Optional[AsyncSession] = None,
+                             **fields) -> bool:
+    """Add a routine notification to the next digest of its ``category``.
+
+    Entries wait in the jobs table, so a restart doesn't lose them and any
+    running instance may post them. Queueing the same ``key`` twice posts
+    it once.
+    """
+    return await enqueue_job(ADMIN_DIGEST_KIND,
+                             f"{key}:admin", {
+                                 "category": category,
+                                 **fields
+                             },
+                             session=session)
+
+
+def _digest_entry_queued(kind: str) -> None:
+    global _pending_digest_entries
+
+    if kind != ADMIN_DIGEST_KIND:
+        return
+    _pending_digest_entries += 1
+    if _pending_digest_entries >= ADMIN_DIGEST_SIZE:
+        ADMIN_DIGEST_READY.set()
+
+
+JOB_LISTENERS.append(_digest_entry_queued)
+
+
+async def post_admin_digest(client: Client) -> int:
+    """Post one digest of up to ADMIN_DIGEST_SIZE waiting notifications.
+
+    Entries are marked done per category once its messages are out, their
+    leases renewed until then. If a send fails they stay leased and come
+    back in a later digest when the lease runs out.
+    """
+    jobs = await claim_jobs((ADMIN_DIGEST_KIND, ), WORKER_ID,
+                            ADMIN_DIGEST_SIZE, ADMIN_DIGEST_LEASE)
+    by_category: Dict[str, List[Jobs]] = {}
+    for job in jobs:
+        by_category.setdefault(job.data["category"], []).append(job)
+
+    posted = 0
+    for category, category_jobs in by_category.items():
+        digest = ADMIN_DIGESTS[category]
+        try:
+            async with hold_job_leases([job.id for job in category_jobs],
+                                       ADMIN_DIGEST_LEASE):
+                for text in digest.render(
+                    [job.data for job in category_jobs]):
+                    await ADMIN_RATE_LIMITER.call(
+                        GROUP_ID,
+                        client.send_message,
+                        GROUP_ID,
+                        text,
+                        reply_to_message_id=TOPIC_ID)
+        except Exception as e:
+            logger.error(
+                f"Error posting the {category} digest of {len(category_jobs)} entries: {e}"
+            )
+            continue
+        await complete_jobs([job.id for job in category_jobs], WORKER_ID)
+        posted += len(category_jobs)
+    if posted:
+        logger.info(f"Posted {posted} admin notifications as a digest")
+    return len(jobs)
+
+
+async def process_admin_digests(client: Client):
+    global _pending_digest_entries
+
+    await asyncio.sleep(10)
+
+    while True:
+        ADMIN_DIGEST_READY.clear()
+        _pending_digest_entries = 0
+        try:
+            # A full digest means more may be waiting.
+            while await post_admin_digest(client) >= ADMIN_DIGEST_SIZE:
+                pass
+        except Exception as e:
+            logger.error(f"Error posting admin digests: {e}")
+
+        try:
+            await asyncio.wait_for(ADMIN_DIGEST_READY.wait(),
+                                   ADMIN_DIGEST_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
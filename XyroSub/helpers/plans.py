@@ -0,0 +1,113 @@
+import re
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from XyroSub import PLANS_CONFIG, SUPPORT_BOT
+
+PLAN_ID_REGEX = re.compile(r'^[a-z0-9]+$')
+PLAN_COUNT_WORDS = ("zero", "one", "two", "three", "four", "five", "six",
+                    "seven", "eight", "nine", "ten")
+
+
+def convert_xtr_to_usd(xtr_price: int) -> int:
+    usd_price = xtr_price * 0.013
+    return round(usd_price)
+
+
+class Plan:
+    """A subscription plan with every derived string computed up front."""
+
+    def __init__(self, plan_id: str, name: str, price: int, days: int,
+                 billing: str, term: str) -> None:
+        self.id = plan_id
+        self.name = name
+        self.price = price
+        self.days = days
+        self.billing = billing
+        self.term = term
+        self.usd_price = convert_xtr_to_usd(price)
+        self.months = days / 30.0
+        self.title = f"{name} Subscription - {term}"
+        self.invoice_description = f"{name} Plan - Billed {billing}."
+        self.subscribe_button_text = f"{name} - {price} XTR ⭐️ (billed {billing})"
+        self.create_button_text = f"{name} - {price} XTR ⭐️ ({term})"
+
+    def __repr__(self) -> str:
+        return f"<Plan id={self.id} price={self.price} days={self.days}>"
+
+
+def _load_plans(plans_config: List[Dict[str, Any]]) -> Dict[str, Plan]:
+    plans: Dict[str, Plan] = {}
+    for plan_config in plans_config:
+        plan_id = str(plan_config["id"]).lower()
+        # Plan ids travel inside callback data and invoice payloads, which
+        # are split on ':', '|' and '_'.
+        if not PLAN_ID_REGEX.match(plan_id) or plan_id == "all":
+            raise ValueError(
+                f"Invalid plan id '{plan_id}': use lowercase letters and digits only, and not 'all'"
+            )
+        price = plan_config.get("price")
+        if price is None or price <= 0:
+            continue
+        days = int(plan_config["days"])
+        plans[plan_id] = Plan(
+            plan_id=plan_id,
+            name=plan_config.get("name") or plan_id.capitalize(),
+            price=int(price),
+            days=days,
+            billing=plan_config.get("billing") or f"every {days} days",
+            term=plan_config.get("term") or f"{days} Days",
+        )
+    return plans
+
+
+PLANS: Dict[str, Plan] = _load_plans(PLANS_CONFIG)
+PLAN_ID_PATTERN = "|".join(PLANS)
+
+premium_message = """
+✨ <b>Hey {{0}}!</b> Thinking about going Premium? You\'ll unlock a treasure trove of amazing features!: ✨
+
+🚀 <b>Premium Plans</b> come in {plan_count} awesome {flavors}:
+{plan_lines}
+
+And guess what? All Premium Plans come with a **no-questions-asked** 3-day refund policy. 💸  
+
+<b>For any subscription or bot-related queries, you can contact us at @{support_bot}</b>.
+
+{{1}}
+"""
+
+# Only the user's name and the discount note change per request.
+PREMIUM_MESSAGE = premium_message.format(
+    plan_count=PLAN_COUNT_WORDS[len(PLANS)]
+    if len(PLANS) < len(PLAN_COUNT_WORDS) else len(PLANS),
+    flavors="flavor" if len(PLANS) == 1 else "flavors",
+    plan_lines="\n".join(
+        f"{index}. <b>{plan.name}</b>: Bills {plan.billing.title()} - <b>{plan.price} XTR ⭐️ (${plan.usd_price} USD)</b>"
+        for index, plan in enumerate(PLANS.values(), start=1)).replace(
+            "{", "{{").replace("}", "}}"),
+    support_bot=SUPPORT_BOT,
+)
+
+
+def get_premium_message(first_name: str, discount_message: str) -> str:
+    return PREMIUM_MESSAGE.format(first_name, discount_message)
+
+
+@lru_cache(maxsize=1024)
+def get_subscribe_keyboard(user_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton(plan.subscribe_button_text,
+                             callback_data=f"subscribe:{plan.id}:{user_id}")
+    ] for plan in PLANS.values()])
+
+
+@lru_cache(maxsize=256)
+def get_create_subscription_keyboard(user_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton(
+            plan.create_button_text,
+            callback_data=f"create_subscription:{plan.id}:{user_id}")
+    ] for plan in PLANS.values()])
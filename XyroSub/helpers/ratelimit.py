@@ -0,0 +1,110 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from pyrogram.errors import FloodWait
+
+from XyroSub import MESSAGES_PER_SECOND, logger
+
+RATE_LIMITERS: Dict[str, "RateLimiter"] = {}
+
+
+class RateLimiter:
+    """Spaces out Telegram API calls to stay inside the flood limits.
+
+    Calls are given slots at most ``rate`` per second overall. Messages also
+    get one slot per second per private chat and one every three seconds per
+    group or channel; calls that send nothing pass ``chat_id=None``. A
+    FloodWait pauses every caller for the time Telegram asks, then the call
+    is retried.
+    """
+
+    def __init__(self, name: str, rate: float) -> None:
+        self.name = name
+        self._interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._chat_slots: Dict[int, float] = {}
+        self._paused_until = 0.0
+        self._background: Set[asyncio.Task] = set()
+        self.calls = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+        RATE_LIMITERS[name] = self
+
+    async def _acquire(self, chat_id: Optional[int]) -> None:
+        # Wait for the chat's own slot first, so a busy group doesn't hold
+        # back the global slots other chats could use meanwhile.
+        if chat_id is not None:
+            now = time.monotonic()
+            chat_slot = max(now, self._chat_slots.get(chat_id, 0.0))
+            self._chat_slots[chat_id] = chat_slot + (1.0
+                                                     if chat_id > 0 else 3.0)
+            if len(self._chat_slots) > 10000:
+                self._chat_slots = {
+                    chat: next_slot
+                    for chat, next_slot in self._chat_slots.items()
+                    if next_slot > now
+                }
+            if chat_slot > now:
+                await asyncio.sleep(chat_slot - now)
+
+        while True:
+            now = time.monotonic()
+            slot = max(now, self._paused_until, self._next_slot)
+            self._next_slot = slot + self._interval
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            # A FloodWait seen while sleeping moves every slot back.
+            if self._paused_until <= time.monotonic():
+                return
+
+    async def call(self, chat_id: Optional[int],
+                   func: Callable[..., Awaitable[Any]], /, *args,
+                   **kwargs) -> Any:
+        while True:
+            await self._acquire(chat_id)
+            self.calls += 1
+            try:
+                return await func(*args, **kwargs)
+            except FloodWait as e:
+                self.flood_waits += 1
+                self.flood_wait_seconds += e.value
+                self._paused_until = max(self._paused_until,
+                                         time.monotonic() + e.value)
+                logger.warning(
+                    f"[{self.name}] FloodWait of {e.value}s on chat {chat_id}, pausing all calls"
+                )
+
+    async def _call_logged(self, chat_id: Optional[int],
+                           func: Callable[..., Awaitable[Any]], /, *args,
+                           **kwargs) -> None:
+        try:
+            await self.call(chat_id, func, *args, **kwargs)
+        except Exception as e:
+            logger.error(f"[{self.name}] Call to chat {chat_id} failed: {e}")
+
+    def call_soon(self, chat_id: Optional[int],
+                  func: Callable[..., Awaitable[Any]], /, *args,
+                  **kwargs) -> asyncio.Task:
+        """Like call(), but in the background so the caller doesn't wait."""
+        task = asyncio.create_task(
+            self._call_logged(chat_id, func, *args, **kwargs))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": self.flood_wait_seconds,
+            "queued": len(self._background),
+            "paused": max(0.0, self._paused_until - time.monotonic()),
+        }
+
+
+TELEGRAM_RATE_LIMITER = RateLimiter("telegram", MESSAGES_PER_SECOND)
+
+
+def get_rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: limiter.stats() for name, limiter in RATE_LIMITERS.items()}
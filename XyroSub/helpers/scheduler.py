@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import (Any, Awaitable, Callable, Dict, Hashable, Iterable, List,
+                    Optional, Set, Tuple)
+
+from XyroSub import logger
+
+SCHEDULERS: Dict[str, "Scheduler"] = {}
+
+
+class RunStats:
+    """Size, duration and throughput of bursts of work.
+
+    A run starts with the first event handled while idle and ends when the
+    caller reports it idle again.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._started: Optional[float] = None
+        self._events = 0
+        self._lag = 0.0
+        self.last_run: Optional[Dict[str, float]] = None
+
+    def started(self, lag: float = 0.0) -> None:
+        if self._started is None:
+            self._started = time.monotonic()
+        self._lag = max(self._lag, lag)
+
+    def finished(self) -> None:
+        self._events += 1
+
+    def idle(self) -> None:
+        if self._started is None:
+            return
+        seconds = time.monotonic() - self._started
+        self.last_run = {
+            "events": self._events,
+            "seconds": seconds,
+            "per_second": self._events / seconds if seconds else 0.0,
+            "max_lag": self._lag,
+            "finished": time.time(),
+        }
+        logger.info(
+            f"[{self.name}] Handled {self._events} events in {seconds:.1f}s "
+            f"({self.last_run['per_second']:.1f}/s, up to {self._lag:.1f}s late)"
+        )
+        self._started = None
+        self._events = 0
+        self._lag = 0.0
+
+
+class Scheduler:
+    """A min-heap of timed events that sleeps until the earliest one is due.
+
+    Every key has one current plan of events. schedule() replaces it and
+    cancel() drops it; entries from older plans stay in the heap and are
+    skipped when they come up, so neither has to search the heap.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._heap: List[Tuple[float, int, Hashable, str, int]] = []
+        self._generations: Dict[Hashable, int] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._tasks: Set[asyncio.Task] = set()
+        self._in_flight = 0
+        self.runs = RunStats(name)
+        self.fired = 0
+        self.skipped = 0
+        SCHEDULERS[name] = self
+
+    def schedule(self, key: Hashable, events: Iterable[Tuple[float,
+                                                              str]]) -> None:
+        generation = next(self._counter)
+        self._generations[key] = generation
+        for when, kind in events:
+            heapq.heappush(self._heap,
+                           (when, next(self._counter), key, kind, generation))
+        if len(self._heap) > 4 * len(self._generations) + 1024:
+            self._compact()
+        self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> None:
+        self._generations.pop(key, None)
+
+    def _compact(self) -> None:
+        self._heap = [
+            entry for entry in self._heap
+            if self._generations.get(entry[2]) == entry[4]
+        ]
+        heapq.heapify(self._heap)
+
+    def next_due(self) -> Optional[float]:
+        return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now: float) -> Optional[Tuple[float, Hashable, str]]:
+        while self._heap and self._heap[0][0] <= now:
+            when, _, key, kind, generation = heapq.heappop(self._heap)
+            if self._generations.get(key) == generation:
+                return when, key, kind
+            self.skipped += 1
+        return None
+
+    async def run(self,
+                  handler: Callable[[Hashable, str, float], Awaitable[Any]],
+                  concurrency: int = 1) -> None:
+        """Hand due events to ``handler``, at most ``concurrency`` at a time.
+
+        Events that come due together form a run; its size, duration and
+        throughput are logged and kept in stats() once the last one is done.
+        """
+        slots = asyncio.Semaphore(concurrency)
+        while True:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                await slots.acquire()
+                event = self._pop_due(time.time())
+                if event is None:
+                    slots.release()
+                    break
+                when, key, kind = event
+                self.runs.started(lag=time.time() - when)
+                self.fired += 1
+                self._in_flight += 1
+                task = asyncio.create_task(
+                    self._dispatch(handler, slots, key, kind, when))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                now = time.time()
+
+            if not self._in_flight:
+                self.runs.idle()
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch(self, handler: Callable[[Hashable, str, float],
+                                                Awaitable[Any]],
+                        slots: asyncio.Semaphore, key: Hashable, kind: str,
+                        when: float) -> None:
+        try:
+            await handler(key, kind, when)
+        except Exception as e:
+            logger.error(
+                f"[{self.name}] Error handling {kind} event for {key}: {e}")
+        finally:
+            slots.release()
+            self._in_flight -= 1
+            self.runs.finished()
+            if not self._in_flight:
+                # Wake run() so it can close the run or start the next one.
+                self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._generations),
+            "queued": len(self._heap),
+            "fired": self.fired,
+            "skipped": self.skipped,
+            "in_flight": self._in_flight,
+            "next_due": self.next_due(),
+            "last_run": self.runs.last_run,
+        }
+
+
+def get_scheduler_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: scheduler.stats() for name, scheduler in SCHEDULERS.items()}
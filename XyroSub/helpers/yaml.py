@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Dict
 
 import yaml
 
@@ -6,4 +6,10 @@ import yaml
 def load_config(filename: str) -> Any:
     with open(filename, "r") as yaml_file:
         config = yaml.safe_load(yaml_file)
-    return config
\ No newline at end of file
+    return config
+
+
+def get_config_value(section: Dict[str, Any], key: str, default: Any) -> Any:
+    """``section.get(key, default)``, but blank keys get the default too."""
+    value = section.get(key)
+    return default if value is None else value
\ No newline at end of file
@@ -1,10 +1,19 @@
+from datetime import datetime, timezone
 
 from pyrogram import filters
 from pyrogram.client import Client
 from pyrogram.types import Message
 
-from XyroSub.database.users import set_blacklist_status
+from XyroSub.database import get_pool_stats
+from XyroSub.database.jobs import get_job_counts
+from XyroSub.database.subscription import (get_subscribed_user_ids,
+                                           get_subscription_cache_stats)
+from XyroSub.database.users import PREMIUM_MEMBERS, set_blacklist_status
 from XyroSub.helpers.decorators import sudo_users
+from XyroSub.helpers.jobs import get_job_worker_stats
+from XyroSub.helpers.locks import get_lock_stats
+from XyroSub.helpers.ratelimit import get_rate_limiter_stats
+from XyroSub.helpers.scheduler import get_scheduler_stats
 
 __module_name__ = ["blacklist"]
 __help_msg__ = """
@@ -15,6 +24,8 @@ The <b>Admins Module</b> provides administrative functionalities for group chats
 
 • <code>/ban user_id</code>: Bans a user from using the bot.
 • <code>/unban user_id</code>: Unbans a user from using the bot.
+• <code>/db_stats</code>: Shows database pool, lock wait, scheduler, job queue and cache statistics.
+• <code>/unsubscribed_members</code>: Lists premium channel members without a subscription.
 """
 
 
@@ -53,4 +64,76 @@ async def unblacklist_user_command(client: Client, message: Message):
     await message.reply_text(
         f"User {user_id} has been unblacklisted!",
         reply_to_message_id=message.id,
-    )
\ No newline at end of file
+    )
+
+
+@Client.on_message(filters.command("db_stats") & filters.group)
+@sudo_users()
+async def db_stats_command(client: Client, message: Message):
+    cache_stats = get_subscription_cache_stats()
+    pool_stats = "\n".join(
+        f"• {name.capitalize()}: <code>{stats['pool']}</code>\n"
+        f"  {stats['connects']} connections opened, {stats['checkouts']} checkouts, "
+        f"{stats['checkins']} checkins, {stats['checked_out']} checked out "
+        f"(peak {stats['peak_checked_out']}), {stats['overflow_checkouts']} overflow\n"
+        f"  checkout wait avg {stats['avg_wait_ms']:.1f} ms, max {stats['max_wait_ms']:.1f} ms"
+        for name, stats in get_pool_stats().items())
+    lock_stats = "\n".join(
+        f"• {name}: {stats['acquisitions']} acquired, {stats['contended']} contended, "
+        f"avg wait {stats['avg_wait_ms']:.1f} ms, max wait {stats['max_wait_ms']:.1f} ms, "
+        f"{stats['keys']} live keys" for name, stats in get_lock_stats().items())
+    scheduler_stats = "\n".join(
+        f"• {name}: {stats['keys']} keys, {stats['queued']} queued, "
+        f"{stats['fired']} fired, {stats['skipped']} skipped, next due "
+        f"{datetime.fromtimestamp(stats['next_due'], tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S') if stats['next_due'] else 'never'}"
+        + (f"\n  last run: {stats['last_run']['events']} events in "
+           f"{stats['last_run']['seconds']:.1f}s ({stats['last_run']['per_second']:.1f}/s), "
+           f"up to {stats['last_run']['max_lag']:.1f}s late"
+           if stats['last_run'] else "")
+        for name, stats in get_scheduler_stats().items())
+    rate_limiter_stats = "\n".join(
+        f"• {name}: {stats['calls']} calls, {stats['queued']} queued, "
+        f"{stats['flood_waits']} FloodWaits ({stats['flood_wait_seconds']}s)"
+        for name, stats in get_rate_limiter_stats().items())
+    job_counts = ", ".join(
+        f"{count} {status}"
+        for status, count in sorted((await get_job_counts()).items()))
+    job_worker_stats = "\n".join(
+        f"• {name}: {stats['in_flight']} running, {stats['succeeded']} done, "
+        f"{stats['retried']} retried, {stats['failed']} failed"
+        for name, stats in get_job_worker_stats().items())
+    await message.reply_text(
+        f"<b>Database Pool Stats:</b>\n{pool_stats}\n\n"
+        f"<b>Keyed Locks:</b>\n{lock_stats or '• None'}\n\n"
+        f"<b>Schedulers:</b>\n{scheduler_stats or '• None'}\n\n"
+        f"<b>Rate Limiters:</b>\n{rate_limiter_stats or '• None'}\n\n"
+        f"<b>Job Queue:</b> {job_counts or 'empty'}\n"
+        f"{job_worker_stats or '• No workers'}\n\n"
+        f"<b>Subscription Cache:</b>\n"
+        f"• Hits: {cache_stats['hits']}\n"
+        f"• Misses: {cache_stats['misses']}\n"
+        f"• Entries: {cache_stats['short_id_entries']} by token, "
+        f"{cache_stats['transaction_id_entries']} by transaction",
+        reply_to_message_id=message.id,
+    )
+
+
+@Client.on_message(filters.command("unsubscribed_members") & filters.group)
+@sudo_users()
+async def unsubscribed_members_command(client: Client, message: Message):
+    unsubscribed = sorted(PREMIUM_MEMBERS - await get_subscribed_user_ids())
+    if not unsubscribed:
+        await message.reply_text(
+            "Every premium channel member has a subscription.",
+            reply_to_message_id=message.id,
+        )
+        return
+
+    shown = "\n".join(f"• <code>{user_id}</code>" for user_id in unsubscribed[:50])
+    more = (f"\n...and {len(unsubscribed) - 50} more"
+            if len(unsubscribed) > 50 else "")
+    await message.reply_text(
+        f"<b>Premium Channel Members Without a Subscription:</b> "
+        f"{len(unsubscribed)}\n{shown}{more}",
+        reply_to_message_id=message.id,
+    )
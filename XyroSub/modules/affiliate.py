@@ -2,14 +2,16 @@ from pyrogram import filters
 from pyrogram.client import Client
 from pyrogram.types import Message
 
-from XyroSub import (AFFILIATE_ALLOWED, GROUP_ID, MINIMUM_COMMISSION_WITHDRAW,
-                     TOPIC_ID, WITHDRAWAL_ALLOWED)
-from XyroSub.database.affiliate import (fetch_affiliate_settings_by_code,
+from XyroSub import (AFFILIATE_ALLOWED, MINIMUM_COMMISSION_WITHDRAW, TOPIC_ID,
+                     WITHDRAWAL_ALLOWED)
+from XyroSub.database.affiliate import (get_affiliate_code,
                                         get_affiliate_settings,
+                                        get_affiliate_user_by_code,
                                         get_commission_info, modify_earnings,
                                         set_affiliate_settings)
 from XyroSub.helpers.decorators import sudo_users
 from XyroSub.helpers.misc import get_bot_object
+from XyroSub.helpers.notifications import notify_admins
 from XyroSub.helpers.string_utils import generate_secure_random_characters
 
 __module_name__ = ["affiliate", "commission"]
@@ -71,26 +73,19 @@ Ready to get started? Share your link and let the rewards roll in! 🚀
     user_id = message.from_user.id
     user_first_name = message.from_user.first_name or 'NoFirstName'
     bot_user = await get_bot_object(client=client)
-    aff_settings = await get_affiliate_settings(affiliate_user=user_id)
+    affiliate_generated_code = await get_affiliate_code(affiliate_user=user_id)
 
-    if not aff_settings:
+    if not affiliate_generated_code:
         affiliate_generated_code = generate_secure_random_characters(ctr=6)
+        while await get_affiliate_user_by_code(affiliate_generated_code):
+            affiliate_generated_code = generate_secure_random_characters(
+                ctr=6)
 
-        while True:
-            aff_set = await fetch_affiliate_settings_by_code(
-                affiliate_code=affiliate_generated_code)
-            if aff_set:
-                affiliate_generated_code = generate_secure_random_characters(
-                    ctr=6)
-            else:
-                break
-    else:
-        affiliate_generated_code = aff_settings.affiliate_code
+        await set_affiliate_settings(affiliate_user=user_id,
+                                     affiliate_code=affiliate_generated_code,
+                                     earnings=0.0)
 
     affiliate_link = f'https://t.me/{bot_user.username}?start={affiliate_generated_code}'
-    await set_affiliate_settings(affiliate_user=user_id,
-                                 affiliate_code=affiliate_generated_code,
-                                 earnings=0.0)
     await message.reply_text(
         affiliate_message.format(
             user_first_name,
@@ -198,9 +193,8 @@ We will verify the request and send the payment to your provided wallet address
         )
         return
 
-    await client.send_message(
-        chat_id=GROUP_ID,
-        text=
+    notify_admins(
+        client,
         f"A user: <code>{user_id}</code> has requested a withdrawal of {aff_settings.earnings} XTR.\n\
 Wallet Address: <code>{wallet_addr}</code>\n\
 Wallet Type: <code>{wallet_type}</code>\n\n\
@@ -256,9 +250,9 @@ async def handle_sudo_withdrawal_command(client: Client,
 Message from administrators: {withdraw_message}\n\n\
 <i>Please be on the lookout for the payment to reflect in your wallet.</i>')
             
-            await client.send_message(
-                chat_id=GROUP_ID,
-                text=f'A withdrawal of {round(aff_settings.earnings)} XTR has been accepted for user <code>{user_id}</code>.'
+            notify_admins(
+                client,
+                f'A withdrawal of {round(aff_settings.earnings)} XTR has been accepted for user <code>{user_id}</code>.'
             )
 
     elif actual_command == 'reject_withdraw':
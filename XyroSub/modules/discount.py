@@ -10,6 +10,7 @@ from XyroSub.database.discount import (change_discount_status, create_discount,
                                        delete_discount, get_act_discount,
                                        get_all_discounts, get_discount)
 from XyroSub.helpers.decorators import sudo_users
+from XyroSub.helpers.plans import PLAN_ID_PATTERN, PLANS
 
 
 def generate_discount_code(length=8):
@@ -159,7 +160,7 @@ async def adjust_value(client: Client, query: CallbackQuery):
 
 def generate_discount_keyboard(scope, value, discount_type, discount_value,
                                plan_scope):
-    plan_scopes = ['all', 'basic', 'standard', 'premium']
+    plan_scopes = ['all', *PLANS]
     next_scope = plan_scopes[(plan_scopes.index(plan_scope) + 1) %
                              len(plan_scopes)]
     return InlineKeyboardMarkup([
@@ -184,9 +185,9 @@ def generate_discount_text():
     return (
         "Let\'s set the Premium Plan for which this discount would be applicable.\n"
         "• <code>All</code>: Discount would be applied to all plans.\n"
-        "• <code>Basic</code>: Discount would be applied to the Basic Plan only.\n"
-        "• <code>Standard</code>: Discount would be applied to the Standard Plan only.\n"
-        "• <code>Premium</code>: Discount would be applicable to the Premium Plan only.\n\n"
+        + "".join(
+            f"• <code>{plan.name}</code>: Discount would be applied to the {plan.name} Plan only.\n"
+            for plan in PLANS.values()) + "\n"
         "Please select one from the button below.\n"
         "Once you are done, press the Done button to create the discount code."
     )
@@ -194,7 +195,7 @@ def generate_discount_text():
 
 @Client.on_callback_query(
     filters.regex(
-        r"^done-(user|time)-(\d+)-(fixed|percentage)-(\d+)(?:-(all|basic|standard|premium)(?:-(done|notdone)))?$"
+        rf"^done-(user|time)-(\d+)-(fixed|percentage)-(\d+)(?:-(all|{PLAN_ID_PATTERN})(?:-(done|notdone)))?$"
     ))
 async def finalize_discount(_: Client, query: CallbackQuery):
     data_parts = query.data.split('-')
@@ -0,0 +1,74 @@
+import asyncio
+from typing import Dict, Optional, Set
+
+from pyrogram import enums, filters
+from pyrogram.client import Client
+from pyrogram.errors import RPCError
+from pyrogram.types import ChatMember, ChatMemberUpdated
+
+from XyroSub import PREMIUM_CHANNEL, logger
+from XyroSub.database.users import (replace_premium_members,
+                                    set_premium_member)
+
+MEMBER_STATUSES = (enums.ChatMemberStatus.OWNER,
+                   enums.ChatMemberStatus.ADMINISTRATOR,
+                   enums.ChatMemberStatus.MEMBER)
+
+# Updates that arrive while sync_premium_members() walks the member list, so
+# the snapshot it saves doesn't undo them.
+_pending_updates: Optional[Dict[int, bool]] = None
+
+
+def is_channel_member(member: Optional[ChatMember]) -> bool:
+    if member is None:
+        return False
+    if member.status == enums.ChatMemberStatus.RESTRICTED:
+        return bool(member.is_member)
+    return member.status in MEMBER_STATUSES
+
+
+async def sync_premium_members(client: Client) -> Optional[int]:
+    """Seed the membership mirror from the channel's member list.
+
+    Runs once at startup, chat member updates keep the mirror current after
+    that. Until it finishes, the mirror saved by the previous run is used.
+    """
+    global _pending_updates
+
+    await asyncio.sleep(10)
+
+    _pending_updates = {}
+    user_ids: Set[int] = set()
+    try:
+        async for member in client.get_chat_members(PREMIUM_CHANNEL):
+            if member.user and not member.user.is_bot and is_channel_member(
+                    member):
+                user_ids.add(member.user.id)
+    except RPCError as e:
+        logger.error(f"Error fetching premium channel members: {e}")
+        _pending_updates = None
+        return None
+
+    pending, _pending_updates = _pending_updates, None
+    for user_id, is_member in pending.items():
+        if is_member:
+            user_ids.add(user_id)
+        else:
+            user_ids.discard(user_id)
+
+    if not await replace_premium_members(user_ids):
+        return None
+    logger.info(f"Synced {len(user_ids)} premium channel members")
+    return len(user_ids)
+
+
+@Client.on_chat_member_updated(filters.chat(PREMIUM_CHANNEL))
+async def premium_member_update_handler(_: Client, update: ChatMemberUpdated):
+    member = update.new_chat_member or update.old_chat_member
+    if not member or not member.user or member.user.is_bot:
+        return
+
+    is_member = is_channel_member(update.new_chat_member)
+    if _pending_updates is not None:
+        _pending_updates[member.user.id] = is_member
+    await set_premium_member(member.user.id, is_member)
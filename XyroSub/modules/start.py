@@ -7,9 +7,9 @@ from pyrogram.types import (BotCommand, BotCommandScopeAllGroupChats,
                             Message)
 
 from XyroSub import ANNOUNCE_CHANNEL, SUPPORT_BOT
-from XyroSub.database.affiliate import (fetch_affiliate_settings_by_code,
+from XyroSub.database.affiliate import (get_affiliate_user_by_code,
                                         save_affiliate_user)
-from XyroSub.database.subscription import get_all_transactions_user
+from XyroSub.database.subscription import count_user_subscriptions
 from XyroSub.database.users import create_user
 from XyroSub.helpers.misc import get_bot_object
 
@@ -74,20 +74,19 @@ Your go-to bot for managing subscription! 🚀
                         'Bot Updates Channel',
                         url=f'https://t.me/{ANNOUNCE_CHANNEL}')
                 ]])
-            aff_settings = await fetch_affiliate_settings_by_code(
-                affiliate_code=command_payload)
-            if aff_settings:
-                if aff_settings.affiliate_user == from_user.id:
+            affiliate_user = await get_affiliate_user_by_code(command_payload)
+            if affiliate_user:
+                if affiliate_user == from_user.id:
                     await client.send_message(
-                        chat_id=aff_settings.affiliate_user,
+                        chat_id=affiliate_user,
                         text="You cannot refer yourself!",
                     )
                 else:
                     # Logic for referring another user
-                    subs_user = await get_all_transactions_user(user_id=from_user.id)
-                    if not subs_user:
+                    if not await count_user_subscriptions(
+                            user_id=from_user.id):
                         await save_affiliate_user(
-                            affiliate_user=aff_settings.affiliate_user,
+                            affiliate_user=affiliate_user,
                             referred_user=from_user.id)
             await message.reply_text(
                 welcome_message,
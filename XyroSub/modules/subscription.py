@@ -1,41 +1,57 @@
 import asyncio
 import re
+from contextlib import AsyncExitStack
 from datetime import datetime, timedelta, timezone
-from typing import Union
+from typing import List, Tuple, Union
 
 from dateutil import relativedelta
 from pyrogram import filters, types
 from pyrogram.client import Client
-from pyrogram.errors import PeerIdInvalid, UserNotParticipant
+from pyrogram.errors import BadRequest, Forbidden, PeerIdInvalid
 from pyrogram.types import (CallbackQuery, InlineKeyboardButton,
                             InlineKeyboardMarkup, Message, PreCheckoutQuery)
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid_extensions import uuid7
 
-from XyroSub import (BASIC_PLAN_DAYS, BASIC_PLAN_PRICE, GROUP_ID, OWNER_ID,
-                     PREMIUM_CHANNEL, PREMIUM_PLAN_DAYS, PREMIUM_PLAN_PRICE,
-                     STANDARD_PLAN_DAYS, STANDARD_PLAN_PRICE, SUPPORT_BOT,
-                     TOPIC_ID, SUDO_USERS, logger)
+from XyroSub import (BILLING_CONCURRENCY, OWNER_ID, TOPIC_ID, SUDO_USERS,
+                     logger)
+from XyroSub.database import session_scope
+from XyroSub.database.jobs import Jobs, enqueue_job
 from XyroSub.database.affiliate import (get_affiliate_settings, get_affiliate_user,
                                         add_referral, delete_affiliate_user,
                                         get_commission_info, modify_earnings,
                                         get_referral_by_short_id)
 from XyroSub.database.discount import (get_active_discount, get_discount_by_id,
-                                       get_discount_usage, save_discount_usage,
+                                       save_discount_usage,
                                        update_discount_usage)
-from XyroSub.database.subscription import (Subscriptions, delete_transaction,
+from XyroSub.database.subscription import (SUBSCRIPTION_LISTENERS,
+                                           Subscriptions, delete_transaction,
                                            get_all_subscriptions,
                                            get_transaction,
                                            get_transaction_by_short_id,
+                                           get_user_subscriptions,
                                            has_active_subscription,
                                            mark_for_cancellation,
+                                           mark_invoice_sent,
                                            save_transaction,
+                                           stream_due_subscriptions,
                                            update_cancel_on_next_invoice,
                                            update_next_invoice_date,
                                            update_transaction)
 from XyroSub.database.users import (check_refund_eligibility,
-                                    create_invite_link, delete_invite_link,
-                                    get_invite_link, mark_refund_used)
+                                    create_invite_link, get_invite_link,
+                                    is_premium_member, mark_refund_used)
 from XyroSub.helpers.decorators import check_blacklist, sudo_users
+from XyroSub.helpers.invite_pool import get_premium_invite_link
+from XyroSub.helpers.jobs import JobWorker
+from XyroSub.helpers.kicks import queue_kick
+from XyroSub.helpers.notifications import notify_admins, queue_admin_digest
+from XyroSub.helpers.locks import KeyedLock
+from XyroSub.helpers.plans import (PLAN_ID_PATTERN, PLANS,
+                                   get_create_subscription_keyboard,
+                                   get_premium_message, get_subscribe_keyboard)
+from XyroSub.helpers.ratelimit import TELEGRAM_RATE_LIMITER
+from XyroSub.helpers.scheduler import Scheduler
 
 __module_name__ = [
     "subscription", "premium", "payment", "donate"
@@ -58,29 +74,17 @@ For further details or specific inquiries, you can use the following ways to get
 • <code>/help premium</code>
 """
 
-premium_message = """
-✨ <b>Hey {0}!</b> Thinking about going Premium? You\'ll unlock a treasure trove of amazing features!: ✨
+PAYMENT_LOCK = KeyedLock("payment")
+AFFILIATE_COMMISSION_LOCK = KeyedLock("affiliate_commission")
 
-🚀 <b>Premium Plans</b> come in three awesome flavors:
-1. <b>Basic</b>: Bills Monthly - <b>{1} XTR ⭐️ (${2} USD)</b>
-2. <b>Standard</b>: Bills Quarterly - <b>{3} XTR ⭐️ (${4} USD)</b>
-3. <b>Premium</b>: Bills Half-Yearly - <b>{5} XTR ⭐️ (${6} USD)</b>
-
-And guess what? All Premium Plans come with a **no-questions-asked** 3-day refund policy. 💸  
-
-<b>For any subscription or bot-related queries, you can contact us at @{7}</b>.
-
-{8}
-"""
-
-def convert_xtr_to_usd(xtr_price: int) -> int:
-    usd_price = xtr_price * 0.013
-    return round(usd_price)
-
-
-BASIC_USD_PRICE = convert_xtr_to_usd(BASIC_PLAN_PRICE)
-STANDARD_USD_PRICE = convert_xtr_to_usd(STANDARD_PLAN_PRICE)
-PREMIUM_USD_PRICE = convert_xtr_to_usd(PREMIUM_PLAN_PRICE)
+# Invoices go out this many days before a subscription's next invoice date.
+INVOICE_REMINDER_DAYS = (3, 2, 1)
+BILLING_SCHEDULER = Scheduler("billing")
+BILLING_LOCK = KeyedLock("billing")
+BILLING_WORKER = JobWorker("billing_jobs", ("invoice", "expire", "cancel"),
+                           concurrency=BILLING_CONCURRENCY)
+NOTIFY_WORKER = JobWorker("notifications", ("notify", ),
+                          concurrency=BILLING_CONCURRENCY)
 
 
 def is_uuid7(transaction_id: str) -> bool:
@@ -127,13 +131,10 @@ async def get_discount_message(user_id: int) -> str:
     discount_message = ""
     available_discounts = await get_active_discount(user_id)
     for discount in available_discounts:
-        used_discount = await get_discount_usage(discount.id,
-                                                 user_id) if discount else None
-        if discount and discount.active and not used_discount:
-            if discount.discount_type == 'percentage':
-                discount_message += f"<b>A discount of {discount.discount_value}% is being applied on {discount.discount_plan_type} {'tiers' if discount.discount_plan_type == 'all' else 'tier'}!</b>\n"
-            else:
-                discount_message += f"<b>A discount of {discount.discount_value} XTR is being applied on {discount.discount_plan_type} {'tiers' if discount.discount_plan_type == 'all' else 'tier'}!</b>\n"
+        if discount.discount_type == 'percentage':
+            discount_message += f"<b>A discount of {discount.discount_value}% is being applied on {discount.discount_plan_type} {'tiers' if discount.discount_plan_type == 'all' else 'tier'}!</b>\n"
+        else:
+            discount_message += f"<b>A discount of {discount.discount_value} XTR is being applied on {discount.discount_plan_type} {'tiers' if discount.discount_plan_type == 'all' else 'tier'}!</b>\n"
     if discount_message:
         discount_message += "<u>Note:</u> The discount will be visible once you press any of the buttons.\n\
 The discount would be a <b>recurring discount</b>."
@@ -141,57 +142,68 @@ The discount would be a <b>recurring discount</b>."
     return discount_message
 
 
-async def affiliate_commission_helper(client: Client,
+async def affiliate_commission_helper(session: AsyncSession,
+                                      affiliate_user_id: int,
                                       user_id: int,
                                       previous_datetime: float,
                                       amount: float,
                                       short_id: str,
-                                      recurring: bool = False) -> None:
-    affiliate_user = await get_affiliate_user(referred_user=user_id)
-    
-    if affiliate_user and affiliate_user.affiliate_user != user_id:
-        current_datetime = datetime.now(timezone.utc).timestamp()
-        current_datetime = datetime.fromtimestamp(current_datetime)
-        previous_datetime = datetime.fromtimestamp(previous_datetime)
-
-        affiliate_amount = 0.0
-        _, referred_users, _ = await get_commission_info(
-            affiliate_user=affiliate_user.affiliate_user)
-        relative_months = relativedelta.relativedelta(current_datetime,
-                                                      previous_datetime).months
-        if referred_users >= 1 and referred_users <= 4 and relative_months <= 12:
-            affiliate_amount = amount * 0.1
-        elif referred_users >= 5 and referred_users <= 9 and relative_months <= 18:
-            affiliate_amount = amount * 0.15
-        elif referred_users >= 10:
-            affiliate_amount = amount * 0.15
-
-        existing_referral = await add_referral(affiliate_user.affiliate_user, user_id, affiliate_amount, short_id)
+                                      recurring: bool = False
+                                      ) -> Tuple[float, bool]:
+    current_datetime = datetime.now(timezone.utc).timestamp()
+    current_datetime = datetime.fromtimestamp(current_datetime)
+    previous_datetime = datetime.fromtimestamp(previous_datetime)
+
+    affiliate_amount = 0.0
+    _, referred_users, _ = await get_commission_info(
+        affiliate_user=affiliate_user_id, session=session)
+    relative_months = relativedelta.relativedelta(
+        current_datetime, previous_datetime).months
+    if referred_users >= 1 and referred_users <= 4 and relative_months <= 12:
+        affiliate_amount = amount * 0.1
+    elif referred_users >= 5 and referred_users <= 9 and relative_months <= 18:
+        affiliate_amount = amount * 0.15
+    elif referred_users >= 10:
+        affiliate_amount = amount * 0.15
+
+    existing_referral = await add_referral(affiliate_user_id,
+                                           user_id,
+                                           affiliate_amount,
+                                           short_id,
+                                           session=session)
+
+    if recurring or existing_referral:
+        await modify_earnings(
+            affiliate_user=affiliate_user_id,
+            earnings=affiliate_amount,
+            session=session,
+        )
 
-        if recurring:
-            await modify_earnings(
-                affiliate_user=affiliate_user.affiliate_user,
-                earnings=affiliate_amount,
-            )
+    return affiliate_amount, existing_referral
+
+
+async def send_affiliate_commission_message(client: Client,
+                                            affiliate_user_id: int,
+                                            user_id: int,
+                                            affiliate_amount: float,
+                                            existing_referral: bool,
+                                            recurring: bool = False) -> None:
+    if recurring:
+        await client.send_message(
+            chat_id=affiliate_user_id,
+            text=f"A user you have referred: <code>{user_id}</code> renewed their subscription.\nYou have earned a commission of {affiliate_amount} XTR!"
+        )
+    else:
+        if existing_referral:
             await client.send_message(
-                chat_id=affiliate_user.affiliate_user,
-                text=f"A user you have referred: <code>{user_id}</code> renewed their subscription.\nYou have earned a commission of {affiliate_amount} XTR!"
+                chat_id=affiliate_user_id,
+                text=f"A user you have referred: <code>{user_id}</code> bought a new subscription.\nYou have earned a commission of {affiliate_amount} XTR!"
             )
         else:
-            if existing_referral:
-                await modify_earnings(
-                    affiliate_user=affiliate_user.affiliate_user,
-                    earnings=affiliate_amount,
-                )
-                await client.send_message(
-                    chat_id=affiliate_user.affiliate_user,
-                    text=f"A user you have referred: <code>{user_id}</code> bought a new subscription.\nYou have earned a commission of {affiliate_amount} XTR!"
-                )
-            else:
-                await client.send_message(
-                    chat_id=affiliate_user.affiliate_user,
-                    text=f"A user you have referred: <code>{user_id}</code> tried to reuse your referral link for a new subscription.\nNo bonus is applied as this is a repeat subscription."
-                )
+            await client.send_message(
+                chat_id=affiliate_user_id,
+                text=f"A user you have referred: <code>{user_id}</code> tried to reuse your referral link for a new subscription.\nNo bonus is applied as this is a repeat subscription."
+            )
 
 
 @Client.on_message(filters.command(["premium", "subscribe"]))
@@ -205,45 +217,16 @@ async def subscribe_handler(_: Client, message: Message):
     
     discount_message = await get_discount_message(from_user.id)
 
-    buttons = []
-
-    if BASIC_PLAN_PRICE is not None and BASIC_PLAN_PRICE > 0:
-        basic_button = InlineKeyboardButton(
-            f"Basic - {BASIC_PLAN_PRICE} XTR ⭐️ (billed monthly)",
-            callback_data=f"subscribe:basic:{from_user.id}"
-        )
-        buttons.append([basic_button])
-    
-    if STANDARD_PLAN_PRICE is not None and STANDARD_PLAN_PRICE > 0:
-        standard_button = InlineKeyboardButton(
-            f"Standard - {STANDARD_PLAN_PRICE} XTR ⭐️ (billed quarterly)",
-            callback_data=f"subscribe:standard:{from_user.id}"
-        )
-        buttons.append([standard_button])
-    
-    if PREMIUM_PLAN_PRICE is not None and PREMIUM_PLAN_PRICE > 0:
-        premium_button = InlineKeyboardButton(
-            f"Premium - {PREMIUM_PLAN_PRICE} XTR ⭐️ (billed half yearly)",
-            callback_data=f"subscribe:premium:{from_user.id}"
-        )
-        buttons.append([premium_button])
-
-    keyboard = InlineKeyboardMarkup(buttons)
-    
-    premium_message_txt = premium_message.format(
-        from_user.first_name or 'NoFirstName', BASIC_PLAN_PRICE,
-        BASIC_USD_PRICE, STANDARD_PLAN_PRICE, STANDARD_USD_PRICE,
-        PREMIUM_PLAN_PRICE, PREMIUM_USD_PRICE, SUPPORT_BOT, discount_message)
-
     await message.reply_text(
-        premium_message_txt,
-        reply_markup=keyboard,
+        get_premium_message(from_user.first_name or 'NoFirstName',
+                            discount_message),
+        reply_markup=get_subscribe_keyboard(from_user.id),
         reply_to_message_id=message.id,
     )
 
 
 @Client.on_callback_query(
-    filters.regex(r"^subscribe:(basic|standard|premium):(\d+)$"))
+    filters.regex(rf"^subscribe:({PLAN_ID_PATTERN}):(\d+)$"))
 async def plan_selection_handler(client: Client,
                                  callback_query: CallbackQuery):
     try:
@@ -257,52 +240,24 @@ async def plan_selection_handler(client: Client,
             await callback_query.answer("You already have an active subscription. Please cancel your current subscription before purchasing a new one.")
             return
         
-        recurring_interval = 0
-        if plan_type == "basic":
-            recurring_interval = BASIC_PLAN_DAYS
-            title = "Basic Subscription - 1 Month"
-            price = BASIC_PLAN_PRICE
-        elif plan_type == "standard":
-            recurring_interval = STANDARD_PLAN_DAYS
-            title = "Standard Subscription - 3 Months"
-            price = STANDARD_PLAN_PRICE
-        elif plan_type == "premium":
-            recurring_interval = PREMIUM_PLAN_DAYS
-            title = "Premium Subscription - 6 Months"
-            price = PREMIUM_PLAN_PRICE
+        plan = PLANS[plan_type]
+        title = plan.title
+        price = plan.price
 
         active_discounts = await get_active_discount(user_id)
         discount_amount = 0
         __used_discount = None
 
+        # get_active_discount() already excludes discounts this user has used.
         for active_discount in active_discounts:
-            if active_discount.max_uses and active_discount.usage_count >= active_discount.max_uses:
-                discount_amount = 0
-                continue
-
-            if active_discount and active_discount.active:
-                used_discount = await get_discount_usage(
-                    discount_id=active_discount.id, user_id=user_id)
-                if used_discount:
-                    discount_amount = 0
-                    continue
-                elif not used_discount and active_discount.discount_plan_type == 'all':
-                    if active_discount.discount_type == 'percentage':
-                        discount_amount = round(
-                            (price * active_discount.discount_value) / 100)
-                    else:
-                        discount_amount = active_discount.discount_value
-                    __used_discount = active_discount
-                    break
-                elif not used_discount:
-                    if active_discount.discount_plan_type == plan_type:
-                        if active_discount.discount_type == 'percentage':
-                            discount_amount = round(
-                                (price * active_discount.discount_value) / 100)
-                        else:
-                            discount_amount = active_discount.discount_value
-                        __used_discount = active_discount
-                        break
+            if active_discount.discount_plan_type in ('all', plan_type):
+                if active_discount.discount_type == 'percentage':
+                    discount_amount = round(
+                        (price * active_discount.discount_value) / 100)
+                else:
+                    discount_amount = active_discount.discount_value
+                __used_discount = active_discount
+                break
 
         __affiliate_discount = 0.0
         aff_settings = await get_affiliate_settings(affiliate_user=user_id)
@@ -369,28 +324,10 @@ async def handle_subscribe_back_btn(client: Client,
 
     discount_message = await get_discount_message(query.from_user.id)
 
-    premium_msg_txt = premium_message.format(
-        query.from_user.first_name or 'NoFirstName', BASIC_PLAN_PRICE,
-        BASIC_USD_PRICE, STANDARD_PLAN_PRICE, STANDARD_USD_PRICE,
-        PREMIUM_PLAN_PRICE, PREMIUM_USD_PRICE, SUPPORT_BOT, discount_message)
-
-    basic_button = InlineKeyboardButton(
-        f"Basic - {BASIC_PLAN_PRICE} XTR ⭐️ (billed monthly)",
-        callback_data=f"subscribe:basic:{query.from_user.id}")
-    standard_button = InlineKeyboardButton(
-        f"Standard - {STANDARD_PLAN_PRICE} XTR ⭐️ (billed quarterly)",
-        callback_data=f"subscribe:standard:{query.from_user.id}")
-    premium_button = InlineKeyboardButton(
-        f"Premium - {PREMIUM_PLAN_PRICE} XTR ⭐️ (billed half-yearly)",
-        callback_data=f"subscribe:premium:{query.from_user.id}")
-
-    keyboard = InlineKeyboardMarkup([
-        [basic_button],
-        [standard_button],
-        [premium_button],
-    ])
-
-    await query.edit_message_text(text=premium_msg_txt, reply_markup=keyboard)
+    await query.edit_message_text(
+        text=get_premium_message(query.from_user.first_name or 'NoFirstName',
+                                 discount_message),
+        reply_markup=get_subscribe_keyboard(query.from_user.id))
 
 @Client.on_pre_checkout_query()
 async def pre_checkout_query_handler(_: Client,
@@ -424,11 +361,11 @@ async def pre_checkout_query_handler(_: Client,
             __discount_obj = await get_discount_by_id(
                 discount_id=int(discount_id))
             datetime_now = datetime.now(timezone.utc).timestamp()
-            if __discount_obj.active == False or (
+            if __discount_obj is None or __discount_obj.active == False or (
                     __discount_obj.expiry_time is not None
                     and __discount_obj.expiry_time < datetime_now
             ) or (__discount_obj.max_uses is not None
-                  and __discount_obj.usage_count == __discount_obj.max_uses):
+                  and __discount_obj.usage_count >= __discount_obj.max_uses):
                 await pre_checkout_query.answer(
                     ok=False,
                     error_message=
@@ -468,6 +405,11 @@ async def pre_checkout_query_handler(_: Client,
 
 @Client.on_message(filters.successful_payment)
 async def successful_payment_handler(client: Client, message: Message):
+    async with PAYMENT_LOCK(message.from_user.id):
+        await process_successful_payment(client, message)
+
+
+async def process_successful_payment(client: Client, message: Message):
     transaction_id = message.successful_payment.telegram_payment_charge_id
     user_id = message.from_user.id
     chat_id = message.chat.id
@@ -483,8 +425,8 @@ async def successful_payment_handler(client: Client, message: Message):
             user_id,
             f"Thank you for your generous donation of {donation_amount} XTR! Your contribution helps us to maintain and improve our services."
         )
-        await client.send_message(
-            GROUP_ID,
+        notify_admins(
+            client,
             f"💰 <b>New Donation Received</b>: \n\n"
             f"• User ID: {user_id}\n"
             f"• Amount: {donation_amount} XTR"
@@ -493,13 +435,8 @@ async def successful_payment_handler(client: Client, message: Message):
     
     plan_type_cleaned = plan_type.split('|')[0]
 
-    recurring_interval = 0
-    if plan_type_cleaned == "basic":
-        recurring_interval = BASIC_PLAN_DAYS
-    elif plan_type_cleaned == "standard":
-        recurring_interval = STANDARD_PLAN_DAYS
-    elif plan_type_cleaned == "premium":
-        recurring_interval = PREMIUM_PLAN_DAYS
+    plan = PLANS.get(plan_type_cleaned)
+    recurring_interval = plan.days if plan else 0
 
     next_invoice_date = payment_date + timedelta(days=recurring_interval)
 
@@ -509,111 +446,135 @@ async def successful_payment_handler(client: Client, message: Message):
     except IndexError:
         commission_used = False
 
-    if discount_used:
-        discount_id = int(payload_data[2].split(':')[1])
-        active_discounts = await get_active_discount(user_id)
-        for active_discount in active_discounts:
-            if active_discount.id == discount_id:
-                await update_discount_usage(active_discount.code)
-                await save_discount_usage(active_discount.id, user_id)
-                break
+    recurring = message.successful_payment.invoice_payload.startswith(
+        "recurring_invoice_")
+
+    affiliate_user = await get_affiliate_user(referred_user=user_id)
+    if affiliate_user and affiliate_user.affiliate_user == user_id:
+        affiliate_user = None
+    commission = None
+
+    # Every database step of the payment commits or rolls back together.
+    # The affiliate lock is held until the commit so that concurrent
+    # referrals see each other's referral counts.
+    async with AsyncExitStack() as stack:
+        if affiliate_user:
+            await stack.enter_async_context(
+                AFFILIATE_COMMISSION_LOCK(affiliate_user.affiliate_user))
+        session = await stack.enter_async_context(session_scope())
+
+        if discount_used:
+            discount_id = int(payload_data[2].split(':')[1])
+            active_discounts = await get_active_discount(user_id,
+                                                         session=session)
+            for active_discount in active_discounts:
+                if active_discount.id == discount_id:
+                    # None means another payment took the last use first.
+                    # This one is already paid at the discounted price, so
+                    # its use is still recorded against the user.
+                    await update_discount_usage(active_discount.code,
+                                                session=session)
+                    await save_discount_usage(active_discount.id,
+                                              user_id,
+                                              session=session)
+                    break
+
+        if commission_used:
+            commission_amount = round(float(payload_data[3].split(':')[1]))
+            if commission_amount > 0:
+                await modify_earnings(affiliate_user=user_id,
+                                      earnings=-commission_amount,
+                                      session=session)
+                amount = amount + commission_amount
+
+        if recurring:
+            payment_payload = message.successful_payment.invoice_payload
+            short_id = payment_payload.split("_")[2]
+            affiliate_discount = round(float(payment_payload.split("_")[4]))
+            existing_transaction = await get_transaction_by_short_id(
+                short_id, session=session)
+            recurring_interval = existing_transaction.recurring_interval
+            next_invoice_date = payment_date + timedelta(
+                days=recurring_interval)
 
-    if commission_used:
-        commission_amount = round(float(payload_data[3].split(':')[1]))
-        if commission_amount > 0:
-            await modify_earnings(affiliate_user=user_id,
-                                  earnings=-commission_amount)
-            amount = amount + commission_amount
-  
-    if message.successful_payment.invoice_payload.startswith(
-            "recurring_invoice_"):
-        payment_payload = message.successful_payment.invoice_payload
-        short_id = payment_payload.split("_")[2]
-        affiliate_discount = round(float(payment_payload.split("_")[4]))
-        existing_transaction = await get_transaction_by_short_id(short_id)
-        recurring_interval = existing_transaction.recurring_interval
-        next_invoice_date = payment_date + timedelta(days=recurring_interval)
-
-        if existing_transaction:
             await update_transaction(existing_transaction.transaction_id,
                                      transaction_id,
                                      (amount + affiliate_discount),
                                      payment_date.timestamp(),
-                                     next_invoice_date.timestamp())
+                                     next_invoice_date.timestamp(),
+                                     session=session)
             if affiliate_discount > 0.0:
                 await modify_earnings(
                     affiliate_user=user_id,
                     earnings=-affiliate_discount,
+                    session=session,
                 )
-            await affiliate_commission_helper(
-                client=client,
+            previous_datetime = existing_transaction.first_time_payment
+            await queue_admin_digest(
+                "renewal",
+                f"renewal:{transaction_id}",
+                session=session,
                 user_id=user_id,
-                previous_datetime=existing_transaction.first_time_payment,
+                short_id=short_id,
+                plan_type=existing_transaction.plan_type.capitalize(),
+                amount=amount,
+                next_invoice_date=next_invoice_date.strftime('%Y-%m-%d'))
+        else:
+            short_id = str(uuid7())
+            await save_transaction(transaction_id,
+                                   short_id,
+                                   user_id,
+                                   amount,
+                                   payment_date.timestamp(),
+                                   next_invoice_date.timestamp(),
+                                   plan_type_cleaned,
+                                   recurring_interval,
+                                   session=session)
+            previous_datetime = payment_date.timestamp()
+
+        if affiliate_user:
+            commission = await affiliate_commission_helper(
+                session=session,
+                affiliate_user_id=affiliate_user.affiliate_user,
+                user_id=user_id,
+                previous_datetime=previous_datetime,
                 amount=amount,
                 short_id=short_id,
-                recurring=True,
+                recurring=recurring,
             )
 
-            await client.send_message(
-                chat_id, f"Thank you for your payment!\n\n"
-                f"Next invoice date: {next_invoice_date.strftime('%Y-%m-%d')}")
-
-            try:
-                await client.get_chat_member(PREMIUM_CHANNEL, user_id)
-                pass
-            except UserNotParticipant:
-                invite_link = await client.create_chat_invite_link(
-                    chat_id=PREMIUM_CHANNEL,
-                    expire_date=datetime.now(timezone.utc) + timedelta(days=1),
-                    member_limit=1
-                )
-                await client.send_message(
-                    user_id,
-                    f"Here is your invite link to the Premium Channel: {invite_link.invite_link}"
-                )
-
-                await create_invite_link(user_id, invite_link.invite_link)
+    if commission:
+        await send_affiliate_commission_message(
+            client,
+            affiliate_user.affiliate_user,
+            user_id,
+            *commission,
+            recurring=recurring,
+        )
 
-            refund_button = InlineKeyboardButton(
-                "Refund", callback_data=f"refund_{short_id}")
-            keyboard = InlineKeyboardMarkup([[refund_button]])
+    if recurring:
+        await client.send_message(
+            chat_id, f"Thank you for your payment!\n\n"
+            f"Next invoice date: {next_invoice_date.strftime('%Y-%m-%d')}")
 
+        if not is_premium_member(user_id):
+            invite_link = await get_premium_invite_link(client)
             await client.send_message(
-                GROUP_ID, f"🔄 <b>Subscription Renewal Notification</b>: \n\n"
-                f"• Action: Subscription Renewed\n"
-                f"• User ID: {user_id}\n"
-                f"• Subscription Token: {short_id}\n"
-                f"• Next Invoice Date: {next_invoice_date.strftime('%Y-%m-%d')}\n"
-                f"• Renewed On: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"• Amount Charged: {amount} XTR\n"
-                f"• Plan Type: {existing_transaction.plan_type.capitalize()}",
-                reply_to_message_id=TOPIC_ID)
-
-            return
-    else:
-        short_id = str(uuid7())
+                user_id,
+                f"Here is your invite link to the Premium Channel: {invite_link}"
+            )
 
-    plan_type_cleaned = plan_type.split('|')[0]
+            await create_invite_link(user_id, invite_link)
 
-    await save_transaction(transaction_id, short_id, user_id, amount,
-                           payment_date.timestamp(),
-                           next_invoice_date.timestamp(), plan_type_cleaned,
-                           recurring_interval)
-    await affiliate_commission_helper(
-        client=client,
-        user_id=user_id,
-        previous_datetime=payment_date.timestamp(),
-        amount=amount,
-        short_id=short_id,
-        recurring=False,
-    )
+        return
 
     refund_button = InlineKeyboardButton("Refund",
                                          callback_data=f"refund_{short_id}")
     keyboard = InlineKeyboardMarkup([[refund_button]])
 
-    await client.send_message(
-        GROUP_ID, f"🆕 <b>New Subscription Notification</b>: \n\n"
+    # Posted right away, it carries the button to refund the payment.
+    notify_admins(
+        client, f"🆕 <b>New Subscription Notification</b>: \n\n"
         f"• Action: New Subscription Created\n"
         f"• User ID: {user_id}\n"
         f"• Plan Type: {plan_type.capitalize()}\n"
@@ -626,37 +587,24 @@ async def successful_payment_handler(client: Client, message: Message):
         chat_id, f"Thank you for your payment!\n\n"
         f"**Next Invoice Date:** {next_invoice_date.strftime('%Y-%m-%d')}\n\n")
 
-    try:
-        await client.get_chat_member(PREMIUM_CHANNEL, user_id)
+    if is_premium_member(user_id):
         await client.send_message(user_id,
                                     "You are already a member of the Premium Channel.")
-    except UserNotParticipant:
-        invite_link = await client.create_chat_invite_link(
-            chat_id=PREMIUM_CHANNEL,
-            expire_date=datetime.now(timezone.utc) + timedelta(days=1),
-            member_limit=1
-        )
+    else:
+        invite_link = await get_premium_invite_link(client)
         await client.send_message(
             user_id,
-            f"Here is your invite link to the Premium Channel: {invite_link.invite_link}"
+            f"Here is your invite link to the Premium Channel: {invite_link}"
         )
-        await create_invite_link(user_id, invite_link.invite_link)
+        await create_invite_link(user_id, invite_link)
 
 async def send_invoice(client: Client, user_id: int, amount: int,
                        short_id: str, plan_type: str,
                        affiliate_discount: float):
     title = "Recurring Invoice"
-    descriptions = {
-        'basic':
-        "Basic Plan - Billed monthly.",
-        'standard':
-        "Standard Plan - Billed quarterly.",
-        'premium':
-        "Premium Plan - Billed half-yearly."
-    }
-
-    description = descriptions.get(plan_type.lower(),
-                                   "Default description for plan type.")
+    plan = PLANS.get(plan_type.lower())
+    description = (plan.invoice_description
+                   if plan else "Default description for plan type.")
 
     if affiliate_discount > 0.0:
         affiliate_discount = round(affiliate_discount)
@@ -671,7 +619,8 @@ async def send_invoice(client: Client, user_id: int, amount: int,
 
     invoice_creation_time = datetime.now(timezone.utc).timestamp()
 
-    await client.send_invoice(
+    await TELEGRAM_RATE_LIMITER.call(
+        user_id, client.send_invoice,
         chat_id=user_id,
         title=title,
         description=description,
@@ -756,17 +705,8 @@ async def confirm_refund_handler(client: Client,
     invite_link_entry = await get_invite_link(user_id)
 
     if invite_link_entry:
-        await client.ban_chat_member(chat_id=PREMIUM_CHANNEL, user_id=user_id)
-        await asyncio.sleep(1)
-        await client.unban_chat_member(chat_id=PREMIUM_CHANNEL, user_id=user_id)
-
-        await client.revoke_chat_invite_link(
-            chat_id=PREMIUM_CHANNEL,
-            invite_link=invite_link_entry.invite_link
-        )
+        await queue_kick(user_id, f"refund:{transaction.transaction_id}")
 
-        await delete_invite_link(user_id)
-                
         await callback_query.message.edit_text(
             "Transaction refunded successfully.")
         await client.send_message(
@@ -775,8 +715,8 @@ async def confirm_refund_handler(client: Client,
             f"Your transaction {transaction.transaction_id} has been refunded successfully."
         )
 
-        await client.send_message(
-            GROUP_ID, f"💰 <b>Refund Notification</b>: \n\n"
+        notify_admins(
+            client, f"💰 <b>Refund Notification</b>: \n\n"
             f"• Action: Refund Processed\n"
             f"• User ID: {user_id}\n"
             f"• Transaction ID: {transaction.transaction_id}\n"
@@ -843,10 +783,7 @@ async def refund_handler(_: Client, message: Message):
 @Client.on_message(filters.command("my_subscriptions"))
 async def my_subscriptions_handler(client, message):
     user_id = message.from_user.id
-    subscriptions = await get_all_subscriptions()
-    user_subscriptions = [
-        sub for sub in subscriptions if sub.user_id == user_id
-    ]
+    user_subscriptions = await get_user_subscriptions(user_id)
 
     if not user_subscriptions:
         await message.reply_text(
@@ -943,13 +880,10 @@ async def cancel_subscription_handler_callback(client, callback_query):
     await callback_query.message.edit_text(
         "Subscription marked for cancellation on the next invoice date.")
 
-    await client.send_message(
-        GROUP_ID, f"📭 <b>Subscription Cancellation Notification</b>: \n\n"
-        f"• Action: Subscription Cancellation\n"
-        f"• User ID: {user_id}\n"
-        f"• Subscription Token: {short_id}\n"
-        f"• Cancellation On: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}",
-        reply_to_message_id=TOPIC_ID)
+    await queue_admin_digest("cancellation",
+                             f"cancellation:{transaction.transaction_id}",
+                             user_id=user_id,
+                             short_id=short_id)
 
 
 @Client.on_callback_query(filters.regex(r"^cancel_cancellation:(\S+)$"))
@@ -974,10 +908,7 @@ async def cancel_cancellation_handler_callback(client, callback_query):
 @Client.on_callback_query(filters.regex(r"^to_subscriptions$"))
 async def back_to_subscriptions_handler(client, callback_query):
     user_id = callback_query.from_user.id
-    subscriptions = await get_all_subscriptions()
-    user_subscriptions = [
-        sub for sub in subscriptions if sub.user_id == user_id
-    ]
+    user_subscriptions = await get_user_subscriptions(user_id)
 
     if not user_subscriptions:
         await callback_query.message.edit_text(
@@ -1048,94 +979,180 @@ async def cancel_subscription_handler(client, message):
         reply_to_message_id=message.id,
     )
 
+
+def billing_events(subscription: Subscriptions,
+                   now: float) -> List[Tuple[float, str]]:
+    due = subscription.next_invoice_date
+    if subscription.cancel_on_next_invoice == 1:
+        return [(due, "cancel")]
+
+    events = [(due, "expire")]
+    last_invoice_date = subscription.last_invoice_date or 0.0
+    reminders = [due - days * 86400 for days in INVOICE_REMINDER_DAYS]
+    # A reminder that came due while the bot was down goes out once, right
+    # away. It keeps its slot's time, which names its job after a restart.
+    missed = [
+        reminder for reminder in reminders
+        if last_invoice_date < reminder <= now
+    ]
+    if due > now and missed:
+        events.append((max(missed), "invoice"))
+    events.extend((reminder, "invoice") for reminder in reminders
+                  if reminder > now)
+    return events
+
+
+def schedule_subscription(subscription: Subscriptions) -> None:
+    BILLING_SCHEDULER.schedule(
+        subscription.short_id,
+        billing_events(subscription,
+                       datetime.now(timezone.utc).timestamp()))
+
+
+SUBSCRIPTION_LISTENERS.append(schedule_subscription)
+
+
+async def enqueue_billing_event(short_id: str, kind: str, when: float):
+    # Every process plans the same events, the key makes sure each one is
+    # queued once however many of them run.
+    await enqueue_job(kind, f"{kind}:{short_id}:{int(when)}", {
+        "short_id": short_id,
+        "when": when
+    })
+
+
+async def queue_notification(job_key: str, name: str, chat_id: int, text: str,
+                             **kwargs):
+    await enqueue_job("notify", f"{job_key}:{name}", {
+        "chat_id": chat_id,
+        "text": text,
+        "kwargs": kwargs
+    })
+
+
+async def send_notification(client: Client, job: Jobs):
+    data = job.data
+    try:
+        await TELEGRAM_RATE_LIMITER.call(data["chat_id"], client.send_message,
+                                         data["chat_id"], data["text"],
+                                         **data["kwargs"])
+    except (BadRequest, Forbidden) as e:
+        # Blocked bots and deleted chats won't get better with retries.
+        logger.warning(
+            f"Dropping notification {job.key} for {data['chat_id']}: {e}")
+
+
+async def handle_billing_event(client: Client, job: Jobs):
+    data = job.data
+    async with BILLING_LOCK(data["short_id"]):
+        await process_billing_event(client, data["short_id"], job.kind,
+                                    data["when"], job.key)
+
+
+async def process_billing_event(client: Client, short_id: str, kind: str,
+                                when: float, job_key: str):
+    # Read straight from the primary, not the cache: acting on a row from
+    # before a renewal could kick a user who just paid.
+    async with session_scope() as session:
+        sub = await get_transaction_by_short_id(short_id, session=session)
+    if sub is None:
+        BILLING_SCHEDULER.cancel(short_id)
+        return
+
+    current_timestamp = datetime.now(timezone.utc).timestamp()
+    next_invoice_timestamp = sub.next_invoice_date
+
+    # Events are planned from the subscription as it was when it last changed,
+    # recheck them against the stored one before acting.
+    if kind == "cancel":
+        if sub.cancel_on_next_invoice != 1 or next_invoice_timestamp > current_timestamp:
+            schedule_subscription(sub)
+            return
+
+        # Queued before the subscription goes, so a retry after a failed
+        # delete doesn't lose or repeat them.
+        await queue_kick(sub.user_id, job_key)
+        await queue_notification(
+            job_key, "user", sub.user_id,
+            f"Your subscription {sub.short_id} has been canceled.")
+        await queue_admin_digest("kick",
+                                 job_key,
+                                 user_id=sub.user_id,
+                                 reason="Subscription canceled")
+        await delete_transaction(sub.transaction_id)
+        BILLING_SCHEDULER.cancel(short_id)
+        return
+
+    if kind == "invoice":
+        if (sub.cancel_on_next_invoice == 1
+                or next_invoice_timestamp <= current_timestamp
+                or (sub.last_invoice_date or 0.0) >= when):
+            return
+
+        affiliate_discount = 0.0
+        aff_settings = await get_affiliate_settings(affiliate_user=sub.user_id)
+        if aff_settings and aff_settings.earnings and aff_settings.earnings > 0.0:
+            affiliate_discount = aff_settings.earnings
+
+        await send_invoice(client, sub.user_id, sub.amount, sub.short_id, sub.plan_type, affiliate_discount)
+        await mark_invoice_sent(sub.transaction_id, current_timestamp)
+
+        is_last_invoice = (next_invoice_timestamp <= current_timestamp + 86400)
+
+        if is_last_invoice:
+            last_invoice_time = datetime.fromtimestamp(next_invoice_timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            await queue_notification(
+                job_key, "user", sub.user_id,
+                f"⚠️ <b>Important:</b> This is your last invoice. "
+                f"If payment is not received by <b>{last_invoice_time} UTC</b>, "
+                f"you will be removed from the Premium Channel and will lose access to premium features."
+            )
+
+        new_next_invoice_timestamp = next_invoice_timestamp + (sub.recurring_interval * 86400)
+
+        await queue_admin_digest(
+            "invoice",
+            job_key,
+            user_id=sub.user_id,
+            short_id=sub.short_id,
+            amount=sub.amount,
+            next_invoice_date=datetime.fromtimestamp(
+                new_next_invoice_timestamp,
+                tz=timezone.utc).strftime('%Y-%m-%d'))
+        return
+
+    if sub.cancel_on_next_invoice == 1 or next_invoice_timestamp > current_timestamp:
+        schedule_subscription(sub)
+        return
+
+    await queue_kick(sub.user_id, job_key)
+    await queue_admin_digest("kick",
+                             job_key,
+                             user_id=sub.user_id,
+                             reason="Invoice not paid")
+    await queue_notification(
+        job_key, "user", sub.user_id,
+        f"You have been removed from the Premium Channel due to your inability to pay the invoice. You may purchase the subscription again if you want to join again."
+    )
+    await delete_transaction(sub.transaction_id)
+    BILLING_SCHEDULER.cancel(short_id)
+
+
 async def auto_send_invoices(client):
     await asyncio.sleep(10)
 
-    while True:
-        current_timestamp = datetime.now(timezone.utc).timestamp()
-        subscriptions = await get_all_subscriptions()
-
-        for sub in subscriptions:
-            next_invoice_timestamp = sub.next_invoice_date
-
-            if sub.cancel_on_next_invoice == 1:
-                if next_invoice_timestamp <= current_timestamp:
-                    await client.ban_chat_member(chat_id=PREMIUM_CHANNEL, user_id=sub.user_id)
-                    await asyncio.sleep(1)
-                    await client.unban_chat_member(chat_id=PREMIUM_CHANNEL, user_id=sub.user_id)
-                    await delete_invite_link(user_id=sub.user_id)
-                    await delete_transaction(sub.transaction_id)
-                    await delete_affiliate_user(user_id=sub.user_id)
-
-                    await client.send_message(
-                        chat_id=sub.user_id,
-                        text=f"Your subscription {sub.short_id} has been canceled."
-                    )
-                    
-                    await client.send_message(
-                        GROUP_ID,
-                        f"🚫 <b>User Kicked from Premium Channel</b>: \n\n"
-                        f"• User ID: {sub.user_id}\n"
-                        f"• Reason: Subscription marked for cancellation."
-                    )
-                continue
-
-            if next_invoice_timestamp <= current_timestamp + 86400 * 3:
-               
-                affiliate_discount = 0.0
-                aff_settings = await get_affiliate_settings(affiliate_user=sub.user_id)
-                if aff_settings and aff_settings.earnings and aff_settings.earnings > 0.0:
-                    affiliate_discount = aff_settings.earnings
-
-                await send_invoice(client, sub.user_id, sub.amount, sub.short_id, sub.plan_type, affiliate_discount)
-
-                is_last_invoice = (next_invoice_timestamp <= current_timestamp + 86400)
-
-                if is_last_invoice:
-                    last_invoice_time = datetime.fromtimestamp(next_invoice_timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-                    await client.send_message(
-                        sub.user_id,
-                        f"⚠️ <b>Important:</b> This is your last invoice. "
-                        f"If payment is not received by <b>{last_invoice_time} UTC</b>, "
-                        f"you will be removed from the Premium Channel and will lose access to premium features."
-                    )
-
-                new_next_invoice_timestamp = next_invoice_timestamp + (sub.recurring_interval * 86400)
-
-                await client.send_message(
-                    GROUP_ID,
-                    f"🔄 <b>Recurring Invoice Sent Notification</b>: \n\n"
-                    f"• Action: Invoice Sent\n"
-                    f"• User ID: {sub.user_id}\n"
-                    f"• Subscription Token: {sub.short_id}\n"
-                    f"• Amount Charged: {sub.amount} XTR\n"
-                    f"• Next Invoice Date: {datetime.fromtimestamp(new_next_invoice_timestamp, tz=timezone.utc).strftime('%Y-%m-%d')}\n"
-                    f"• Invoice Sent On: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}",
-                    reply_to_message_id=TOPIC_ID)
-
-                sub.next_invoice_date = new_next_invoice_timestamp
-
-            if next_invoice_timestamp < current_timestamp:
-                await client.ban_chat_member(chat_id=PREMIUM_CHANNEL, user_id=sub.user_id)
-                await asyncio.sleep(1)
-                await client.unban_chat_member(chat_id=PREMIUM_CHANNEL, user_id=sub.user_id)
-                await delete_invite_link(user_id=sub.user_id)
-                await delete_transaction(sub.transaction_id)
-                await delete_affiliate_user(user_id=sub.user_id)
-
-                await client.send_message(
-                    GROUP_ID,
-                    f"🚫 <b>User Kicked from Premium Channel</b>: \n\n"
-                    f"• User ID: {sub.user_id}\n"
-                    f"• Reason: Invoice payment failed.",
-                    reply_to_message_id=TOPIC_ID)
-
-                await client.send_message(
-                    sub.user_id,
-                    f"You have been removed from the Premium Channel due to your inability to pay the invoice. You may purchase the subscription again if you want to join again."
-                )
+    scheduled = 0
+    async for sub in stream_due_subscriptions():
+        schedule_subscription(sub)
+        scheduled += 1
+    logger.info(f"Scheduled billing events for {scheduled} subscriptions")
 
-        await asyncio.sleep(86400)
+    # The scheduler only queues due events; the workers act on them, picking
+    # up where a previous run of the bot, or another instance, left off.
+    await asyncio.gather(
+        BILLING_SCHEDULER.run(enqueue_billing_event),
+        BILLING_WORKER.run(lambda job: handle_billing_event(client, job)),
+        NOTIFY_WORKER.run(lambda job: send_notification(client, job)))
 
 
 @Client.on_message(filters.command("create_subscription"))
@@ -1150,47 +1167,25 @@ async def create_subscription_handler(client: Client, message: Message):
         )
         return
 
-    basic_button = InlineKeyboardButton(
-        f"Basic - {BASIC_PLAN_PRICE} XTR ⭐️ (1 Month)",
-        callback_data=f"create_subscription:basic:{user_id}")
-    standard_button = InlineKeyboardButton(
-        f"Standard - {STANDARD_PLAN_PRICE} XTR ⭐️ (3 Months)",
-        callback_data=f"create_subscription:standard:{user_id}")
-    premium_button = InlineKeyboardButton(
-        f"Premium - {PREMIUM_PLAN_PRICE} XTR ⭐️ (6 Months)",
-        callback_data=f"create_subscription:premium:{user_id}")
-    keyboard = InlineKeyboardMarkup([[basic_button], [standard_button],
-                                     [premium_button]])
-
     await message.reply_text(
         "Please select a subscription plan:",
-        reply_markup=keyboard,
+        reply_markup=get_create_subscription_keyboard(user_id),
         reply_to_message_id=message.id,
     )
 
 
 @Client.on_callback_query(
-    filters.regex(r"^create_subscription:(basic|standard|premium):(\d+)$"))
+    filters.regex(rf"^create_subscription:({PLAN_ID_PATTERN}):(\d+)$"))
 async def handle_create_subscription_plan_selection(
         client: Client, callback_query: CallbackQuery):
     plan_type, user_id = callback_query.data.split(":")[1:]
     user_id = int(user_id)
 
-    if plan_type == "basic":
-        title = "Basic Subscription - 1 Month"
-        price = BASIC_PLAN_PRICE
-        recurring_interval = BASIC_PLAN_DAYS
-        plan_token = "basic"
-    elif plan_type == "standard":
-        title = "Standard Subscription - 3 Months"
-        price = STANDARD_PLAN_PRICE
-        recurring_interval = STANDARD_PLAN_DAYS
-        plan_token = "standard"
-    elif plan_type == "premium":
-        title = "Premium Subscription - 6 Months"
-        price = PREMIUM_PLAN_PRICE
-        recurring_interval = PREMIUM_PLAN_DAYS
-        plan_token = "premium"
+    plan = PLANS[plan_type]
+    title = plan.title
+    price = plan.price
+    recurring_interval = plan.days
+    plan_token = plan.id
 
     short_id = str(uuid7())
     transaction_id = str(uuid7())
@@ -1202,8 +1197,8 @@ async def handle_create_subscription_plan_selection(
                            next_invoice_date.timestamp(), plan_token,
                            recurring_interval)
 
-    await client.send_message(
-        GROUP_ID, f"🆕 <b>New Subscription Notification</b>: \n\n"
+    notify_admins(
+        client, f"🆕 <b>New Subscription Notification</b>: \n\n"
         f"• Action: New Subscription Created\n"
         f"• User ID: {user_id}\n"
         f"• Plan Type: {plan_token.capitalize()}\n"
@@ -1282,17 +1277,8 @@ async def handle_cancel_choice(client: Client, callback_query):
     invite_link_entry = await get_invite_link(user_id)
 
     if invite_link_entry:
-        await client.ban_chat_member(chat_id=PREMIUM_CHANNEL, user_id=user_id)
-        await asyncio.sleep(1)
-        await client.unban_chat_member(chat_id=PREMIUM_CHANNEL, user_id=user_id)
+        await queue_kick(user_id, f"cancel:{transaction.transaction_id}")
 
-        await client.revoke_chat_invite_link(
-            chat_id=PREMIUM_CHANNEL,
-            invite_link=invite_link_entry.invite_link
-        )
-
-        await delete_invite_link(user_id)
-        
         await callback_query.answer("Subscription cancelled immediately.")
     else:
         await mark_for_cancellation(transaction.transaction_id)
@@ -1332,7 +1318,7 @@ async def extend_subscription_handler(client: Client, message: Message):
 
     new_next_invoice_date = datetime.fromtimestamp(
         transaction.next_invoice_date,
-        tz=timezone.utc) + timedelta(days=BASIC_PLAN_DAYS * months)
+        tz=timezone.utc) + timedelta(days=30 * months)
 
     await update_next_invoice_date(transaction.transaction_id,
                                    new_next_invoice_date.timestamp())
@@ -1342,15 +1328,13 @@ async def extend_subscription_handler(client: Client, message: Message):
         reply_to_message_id=message.id,
     )
 
-    await client.send_message(
-        GROUP_ID, f"⏳ <b>Subscription Extension Notification</b>: \n\n"
-        f"• Action: Subscription Extended\n"
-        f"• User ID: {user_id}\n"
-        f"• Subscription Token: {short_id}\n"
-        f"• Extended By: {months} month(s)\n"
-        f"• New Next Invoice Date: {new_next_invoice_date.strftime('%Y-%m-%d')}\n"
-        f"• Extension Processed On: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}",
-        reply_to_message_id=TOPIC_ID)
+    await queue_admin_digest(
+        "extension",
+        f"extension:{transaction.transaction_id}:{int(new_next_invoice_date.timestamp())}",
+        user_id=user_id,
+        short_id=short_id,
+        months=months,
+        next_invoice_date=new_next_invoice_date.strftime('%Y-%m-%d'))
 
 
 @Client.on_message(filters.command("income"))
@@ -1359,26 +1343,22 @@ async def stats_handler(client: Client, message: Message):
     subscriptions = await get_all_subscriptions()
 
     total_users = len(subscriptions)
-    basic_users = sum(1 for sub in subscriptions if sub.plan_type == "basic")
-    standard_users = sum(1 for sub in subscriptions if sub.plan_type == "standard")
-    premium_users = sum(1 for sub in subscriptions if sub.plan_type == "premium")
+    plan_users = dict.fromkeys(PLANS, 0)
 
     total_monthly_income = 0
 
     for sub in subscriptions:
-        if sub.plan_type == "basic":
-            total_monthly_income += sub.amount / (BASIC_PLAN_DAYS / 30.0)
-        elif sub.plan_type == "standard":
-            total_monthly_income += sub.amount / (STANDARD_PLAN_DAYS / 30.0)
-        elif sub.plan_type == "premium":
-            total_monthly_income += sub.amount / (PREMIUM_PLAN_DAYS / 30.0)
+        plan = PLANS.get(sub.plan_type)
+        if plan:
+            plan_users[plan.id] += 1
+            total_monthly_income += sub.amount / plan.months
 
+    plan_lines = "".join(f" - {plan.name} Plan Users: {plan_users[plan.id]}\n"
+                         for plan in PLANS.values())
     response = (
         f"**Statistics:**\n"
         f"Total Paying Users: {total_users}\n"
-        f" - Basic Plan Users: {basic_users}\n"
-        f" - Standard Plan Users: {standard_users}\n"
-        f" - Premium Plan Users: {premium_users}\n"
+        f"{plan_lines}"
         f"**Monthly Income:** {round(total_monthly_income, 2)} XTR"
     )
 
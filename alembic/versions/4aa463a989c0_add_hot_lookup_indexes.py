@@ -0,0 +1,38 @@
+"""add hot lookup indexes
+
+Revision ID: 4aa463a989c0
+Revises: 
+Create Date: 2026-10-16 22:35:33.728148
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4aa463a989c0'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # start_db() creates these for fresh databases, so only add missing ones.
+    op.create_index('ix_affiliate_settings_affiliate_code', 'affiliate_settings', ['affiliate_code'], unique=False, if_not_exists=True)
+    op.create_index('ix_affiliate_users_affiliate_user', 'affiliate_users', ['affiliate_user'], unique=False, if_not_exists=True)
+    op.create_index('ix_discount_usage_user_id', 'discount_usage', ['user_id', 'discount_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_referrals_affiliate_user_id', 'referrals', ['affiliate_user_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_subscriptions_next_invoice_date', 'subscriptions', ['next_invoice_date', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_subscriptions_transaction_id', 'subscriptions', ['transaction_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_subscriptions_user_id_cancel', 'subscriptions', ['user_id', 'cancel_on_next_invoice'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_subscriptions_user_id_cancel', table_name='subscriptions', if_exists=True)
+    op.drop_index('ix_subscriptions_transaction_id', table_name='subscriptions', if_exists=True)
+    op.drop_index('ix_subscriptions_next_invoice_date', table_name='subscriptions', if_exists=True)
+    op.drop_index('ix_referrals_affiliate_user_id', table_name='referrals', if_exists=True)
+    op.drop_index('ix_discount_usage_user_id', table_name='discount_usage', if_exists=True)
+    op.drop_index('ix_affiliate_users_affiliate_user', table_name='affiliate_users', if_exists=True)
+    op.drop_index('ix_affiliate_settings_affiliate_code', table_name='affiliate_settings', if_exists=True)
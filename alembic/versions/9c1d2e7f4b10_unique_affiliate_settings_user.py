@@ -0,0 +1,26 @@
+"""unique affiliate_settings.affiliate_user
+
+Revision ID: 9c1d2e7f4b10
+Revises: 4aa463a989c0
+Create Date: 2026-10-16 22:52:10.114203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1d2e7f4b10'
+down_revision: Union[str, None] = '4aa463a989c0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Conflict target for the set_affiliate_settings() upsert.
+    op.create_index('ux_affiliate_settings_affiliate_user', 'affiliate_settings', ['affiliate_user'], unique=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ux_affiliate_settings_affiliate_user', table_name='affiliate_settings', if_exists=True)
@@ -0,0 +1,37 @@
+"""add invite_link_pool
+
+Revision ID: b7e4a1c9d302
+Revises: 9c1d2e7f4b10
+Create Date: 2026-10-16 23:41:07.512390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e4a1c9d302'
+down_revision: Union[str, None] = '9c1d2e7f4b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Premium channel invite links minted ahead of payments. start_db() may
+    # already have created the table.
+    if sa.inspect(op.get_bind()).has_table('invite_link_pool'):
+        return
+    op.create_table(
+        'invite_link_pool',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('invite_link', sa.String(), nullable=False),
+        sa.Column('expire_date', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('invite_link'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('invite_link_pool')
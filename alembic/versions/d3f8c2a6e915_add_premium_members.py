@@ -0,0 +1,34 @@
+"""add premium_members
+
+Revision ID: d3f8c2a6e915
+Revises: b7e4a1c9d302
+Create Date: 2026-10-16 23:58:21.604417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f8c2a6e915'
+down_revision: Union[str, None] = 'b7e4a1c9d302'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Mirror of the premium channel's members. start_db() may already have
+    # created the table.
+    if sa.inspect(op.get_bind()).has_table('premium_members'):
+        return
+    op.create_table(
+        'premium_members',
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('premium_members')
@@ -0,0 +1,32 @@
+"""add subscriptions.last_invoice_date
+
+Revision ID: e6a1b5d0c428
+Revises: d3f8c2a6e915
+Create Date: 2026-10-17 00:31:46.219054
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a1b5d0c428'
+down_revision: Union[str, None] = 'd3f8c2a6e915'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # When the last recurring invoice went out, so a restart doesn't resend it.
+    columns = sa.inspect(op.get_bind()).get_columns('subscriptions')
+    if any(column['name'] == 'last_invoice_date' for column in columns):
+        return
+    op.add_column('subscriptions',
+                  sa.Column('last_invoice_date', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('subscriptions') as batch_op:
+        batch_op.drop_column('last_invoice_date')
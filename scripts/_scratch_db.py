@@ -0,0 +1,29 @@
+"""Run the bot's database code against a throwaway SQLite file.
+
+XyroSub reads config.yml from the working directory when it is imported, so
+benchmarks that exercise the real helpers call use_scratch_database() first.
+It copies the repository's config.yml into ``directory`` with the schema
+pointed at a new SQLite file there and no read replica, and switches to it.
+"""
+import os
+import sys
+from pathlib import Path
+
+import yaml
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def use_scratch_database(directory: str) -> str:
+    with open(PROJECT_DIR / "config.yml", "r") as yaml_file:
+        config = yaml.safe_load(yaml_file)
+
+    database = Path(directory) / "bench.db"
+    config["database"]["schema"] = f"sqlite+aiosqlite:///{database}"
+    config["database"]["replica_schema"] = None
+    with open(Path(directory) / "config.yml", "w") as yaml_file:
+        yaml.safe_dump(config, yaml_file)
+
+    os.chdir(directory)
+    sys.path.insert(0, str(PROJECT_DIR))
+    return str(database)
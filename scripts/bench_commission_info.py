@@ -0,0 +1,106 @@
+"""Time get_commission_info() against the per-referral lookups it replaced.
+
+An affiliate with 10,000 referrals, 5,000 of them with one to three
+subscriptions, in a 60,000-referral dataset on a throwaway SQLite database.
+Both versions should return the same (earnings, converted, total) tuple.
+Needs a filled in config.yml in the repository root, only its schema is
+replaced.
+
+    python scripts/bench_commission_info.py
+"""
+import asyncio
+import tempfile
+import time
+
+from _scratch_db import use_scratch_database
+
+REFERRALS = 60_000
+AFFILIATE_REFERRALS = 10_000
+AFFILIATE = 1
+
+
+async def n_plus_one_commission_info(affiliate_user: int):
+    """The old get_commission_info(): one subscription query per referral."""
+    from sqlalchemy import select
+
+    from XyroSub.database import async_session
+    from XyroSub.database.affiliate import AffiliateSettings, AffiliateUsers
+    from XyroSub.database.subscription import Subscriptions
+
+    earnings, referred_users = 0.0, 0
+    async with async_session() as session:
+        async with session.begin():
+            ref_users = (await session.execute(
+                select(AffiliateUsers).where(
+                    AffiliateUsers.affiliate_user == affiliate_user))
+                         ).scalars().all()
+    for ref_user in ref_users:
+        async with async_session() as session:
+            async with session.begin():
+                subscriptions = (await session.execute(
+                    select(Subscriptions).where(
+                        Subscriptions.user_id == ref_user.referred_user))
+                                 ).all()
+        if subscriptions:
+            referred_users += 1
+    async with async_session() as session:
+        async with session.begin():
+            aff_set = (await session.execute(
+                select(AffiliateSettings).where(
+                    AffiliateSettings.affiliate_user == affiliate_user))
+                       ).scalar_one_or_none()
+            if aff_set:
+                earnings = aff_set.earnings
+    return earnings, referred_users, len(ref_users)
+
+
+async def populate() -> None:
+    from sqlalchemy import insert
+
+    from XyroSub.database import async_session
+    from XyroSub.database.affiliate import AffiliateSettings, AffiliateUsers
+    from XyroSub.database.subscription import Subscriptions
+
+    subscriptions = [{
+        "transaction_id": f"t{i}_{k}",
+        "short_id": f"s{i}_{k}",
+        "user_id": 100 + i,
+        "amount": 1,
+        "payment_date": 0,
+        "next_invoice_date": 0,
+        "plan_type": "basic",
+        "recurring_interval": 30,
+        "cancel_on_next_invoice": False,
+    } for i in range(0, REFERRALS, 2) for k in range(1 + i % 3)]
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(insert(AffiliateUsers), [{
+                "affiliate_user":
+                AFFILIATE if i < AFFILIATE_REFERRALS else 2 + i % 50,
+                "referred_user": 100 + i,
+            } for i in range(REFERRALS)])
+            await session.execute(insert(Subscriptions), subscriptions)
+            session.add(AffiliateSettings(AFFILIATE, "abcdef", 42.5))
+
+
+async def main() -> None:
+    from XyroSub.database import start_db, stop_db
+    from XyroSub.database.affiliate import get_commission_info
+
+    await start_db()
+    try:
+        await populate()
+        for name, lookup in (("before (N+1)", n_plus_one_commission_info),
+                             ("after (aggregate)", get_commission_info)):
+            start = time.perf_counter()
+            result = await lookup(AFFILIATE)
+            elapsed = 1000 * (time.perf_counter() - start)
+            print(f"{name:20s} {elapsed:10.1f} ms  {result}")
+    finally:
+        await stop_db()
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        use_scratch_database(tmp)
+        asyncio.run(main())
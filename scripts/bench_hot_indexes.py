@@ -0,0 +1,110 @@
+"""Time the hot lookups on SQLite before and after the 4aa463a989c0 indexes.
+
+Builds two throwaway databases of 500k subscriptions and affiliate rows in a
+temporary directory, one without and one with the indexes, and prints the
+average time per query along with SQLite's query plan.
+
+    python scripts/bench_hot_indexes.py
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+ROWS = 500_000
+USERS = 200_000
+AFFILIATES = 5_000
+RUNS = 50
+
+SCHEMA = """
+CREATE TABLE subscriptions (
+    id INTEGER PRIMARY KEY, transaction_id VARCHAR, short_id VARCHAR UNIQUE,
+    user_id BIGINT, amount INTEGER, payment_date FLOAT,
+    next_invoice_date FLOAT, cancel_on_next_invoice INTEGER,
+    plan_type VARCHAR, recurring_interval INTEGER,
+    first_time_payment FLOAT, affiliate_code VARCHAR
+);
+CREATE TABLE affiliate_users (
+    affiliate_user BIGINT, referred_user BIGINT PRIMARY KEY
+);
+CREATE TABLE affiliate_settings (
+    affiliate_user BIGINT, affiliate_code VARCHAR, earnings FLOAT,
+    PRIMARY KEY (affiliate_user, affiliate_code)
+);
+"""
+
+# The subscriptions and affiliate indexes from
+# alembic/versions/4aa463a989c0_add_hot_lookup_indexes.py.
+INDEXES = """
+CREATE INDEX ix_subscriptions_user_id_cancel
+    ON subscriptions (user_id, cancel_on_next_invoice);
+CREATE INDEX ix_subscriptions_next_invoice_date
+    ON subscriptions (next_invoice_date, id);
+CREATE INDEX ix_subscriptions_transaction_id ON subscriptions (transaction_id);
+CREATE INDEX ix_affiliate_users_affiliate_user
+    ON affiliate_users (affiliate_user);
+CREATE INDEX ix_affiliate_settings_affiliate_code
+    ON affiliate_settings (affiliate_code);
+"""
+
+QUERIES = {
+    "active sub by user":
+    ("SELECT EXISTS (SELECT 1 FROM subscriptions "
+     "WHERE user_id = ? AND cancel_on_next_invoice = 0)",
+     lambda: (random.randrange(USERS), )),
+    "subs by transaction_id":
+    ("SELECT * FROM subscriptions WHERE transaction_id = ?",
+     lambda: (f"tx{random.randrange(ROWS)}", )),
+    "due invoices (1 day window)":
+    ("SELECT id FROM subscriptions WHERE next_invoice_date <= ? "
+     "ORDER BY next_invoice_date, id LIMIT 500", lambda: (1.7e9 + 86400, )),
+    "referrals of affiliate":
+    ("SELECT COUNT(*) FROM affiliate_users WHERE affiliate_user = ?",
+     lambda: (random.randrange(AFFILIATES), )),
+    "affiliate by code":
+    ("SELECT * FROM affiliate_settings WHERE affiliate_code = ?",
+     lambda: (f"c{random.randrange(ROWS):05d}", )),
+}
+
+
+def build(path: str, with_indexes: bool) -> sqlite3.Connection:
+    random.seed(1)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        "INSERT INTO subscriptions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((i, f"tx{i}", f"s{i}", random.randrange(USERS), 100, 0,
+          1.7e9 + random.random() * 1.6e7, random.random() < .1, "basic", 30,
+          0, None) for i in range(ROWS)))
+    conn.executemany("INSERT INTO affiliate_users VALUES (?, ?)",
+                     ((random.randrange(AFFILIATES), i) for i in range(ROWS)))
+    conn.executemany("INSERT INTO affiliate_settings VALUES (?, ?, 0)",
+                     ((i, f"c{i:05d}") for i in range(ROWS)))
+    if with_indexes:
+        conn.executescript(INDEXES)
+    conn.commit()
+    conn.execute("ANALYZE")
+    return conn
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, with_indexes in (("before", False), ("after", True)):
+            conn = build(os.path.join(tmp, f"{label}.db"), with_indexes)
+            print(f"== {label}")
+            for name, (query, args) in QUERIES.items():
+                plan = " | ".join(
+                    row[-1]
+                    for row in conn.execute("EXPLAIN QUERY PLAN " + query,
+                                            args()))
+                start = time.perf_counter()
+                for _ in range(RUNS):
+                    conn.execute(query, args()).fetchall()
+                elapsed = 1000 * (time.perf_counter() - start) / RUNS
+                print(f"{name:30s} {elapsed:8.3f} ms  {plan}")
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
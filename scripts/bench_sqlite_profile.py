@@ -0,0 +1,108 @@
+"""Measure SQLite throughput with and without the connection profile.
+
+Runs the same mix of 2,000 operations, 32 at a time (500 atomic earnings
+updates and 1,500 per-user subscription reads), through the bot's own
+helpers in three configurations, each on a fresh database file:
+
+- NullPool with SQLite's default pragmas, as aiosqlite sets it up
+- a pooled engine with the default DELETE journal and synchronous=FULL
+- the bot's engine, pooled with the SQLITE_PRAGMAS profile
+
+Needs a filled in config.yml in the repository root, only its schema is
+replaced.
+
+    python scripts/bench_sqlite_profile.py [concurrency]
+"""
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _scratch_db import use_scratch_database
+
+WRITES = 500
+READS = 1_500
+AFFILIATES = 200
+USERS = 300
+SUBSCRIPTIONS = 2_000
+
+
+async def run_workload(concurrency: int):
+    from XyroSub.database.affiliate import (modify_earnings,
+                                            set_affiliate_settings)
+    from XyroSub.database.subscription import (get_user_subscriptions,
+                                               has_active_subscription,
+                                               save_transaction)
+
+    for i in range(AFFILIATES):
+        await set_affiliate_settings(i, f"c{i:05d}", 0.0)
+    for i in range(SUBSCRIPTIONS):
+        await save_transaction(f"t{i}", f"s{i}", i % USERS, 1, 0, float(i),
+                               "basic", 30)
+
+    failed_writes = 0
+
+    async def write(i: int) -> None:
+        nonlocal failed_writes
+        if await modify_earnings(i % AFFILIATES, 1) is not True:
+            failed_writes += 1
+
+    async def read(i: int) -> None:
+        await get_user_subscriptions(i % USERS)
+        await has_active_subscription(i % USERS)
+
+    operations = [write(i) for i in range(WRITES)]
+    operations += [read(i) for i in range(READS)]
+    random.seed(1)
+    random.shuffle(operations)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(operation) -> None:
+        async with semaphore:
+            await operation
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited(operation) for operation in operations))
+    return len(operations) / (time.perf_counter() - start), failed_writes
+
+
+async def main(directory: str, concurrency: int) -> None:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+    from XyroSub.database import (BASE, async_read_session, async_session,
+                                  engine, start_db)
+
+    await start_db()
+    profiles = (
+        ("NullPool, default pragmas",
+         create_async_engine(
+             f"sqlite+aiosqlite:///{Path(directory) / 'nullpool.db'}",
+             poolclass=NullPool)),
+        ("pooled, DELETE/FULL",
+         create_async_engine(
+             f"sqlite+aiosqlite:///{Path(directory) / 'pooled.db'}",
+             poolclass=AsyncAdaptedQueuePool)),
+        ("pooled, WAL/NORMAL profile", engine),
+    )
+    for name, profile_engine in profiles:
+        async with profile_engine.begin() as conn:
+            await conn.run_sync(BASE.metadata.create_all)
+        async_session.configure(bind=profile_engine)
+        async_read_session.configure(bind=profile_engine)
+        try:
+            per_second, failed_writes = await run_workload(concurrency)
+        finally:
+            await profile_engine.dispose()
+        print(f"{name:30s} {per_second:6.0f} ops/s, "
+              f"{failed_writes} failed writes")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        use_scratch_database(tmp)
+        asyncio.run(
+            main(tmp,
+                 int(sys.argv[1]) if len(sys.argv) > 1 else 32))